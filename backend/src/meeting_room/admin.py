@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Room, CustomUser, RoomParticipant, DataStream
+from .models import Room, CustomUser, RoomParticipant, DataStream, FocusSample, FocusRollup
 # from django.contrib.auth.models import Token
 
 
@@ -39,11 +39,30 @@ class DataStreamAdmin(admin.ModelAdmin):
     date_hierarchy = 'timestamp'
 
 
+class FocusSampleAdmin(admin.ModelAdmin):
+    list_display = ('room', 'user', 'score', 'status', 'ts')
+    search_fields = ('room__name', 'user__username')
+    ordering = ('-ts',)
+    list_per_page = 20
+    date_hierarchy = 'ts'
+
+
+class FocusRollupAdmin(admin.ModelAdmin):
+    list_display = ('room', 'user', 'resolution', 'bucket', 'count', 'mean')
+    search_fields = ('room__name', 'user__username')
+    list_filter = ('resolution',)
+    ordering = ('-bucket',)
+    list_per_page = 20
+    date_hierarchy = 'bucket'
+
+
 # Register our models
 admin.site.register(Room, RoomAdmin)
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(RoomParticipant, RoomParticipantAdmin)
 admin.site.register(DataStream, DataStreamAdmin)
+admin.site.register(FocusSample, FocusSampleAdmin)
+admin.site.register(FocusRollup, FocusRollupAdmin)
 
 # Register Token model with default admin
 # admin.site.register(Token)
@@ -0,0 +1,89 @@
+import math
+from array import array
+
+# Aggregate settings
+EMA_ALPHA = 0.1  # Weight of the latest score in the moving average
+HISTOGRAM_BUCKETS = 10  # Equal buckets over scores 0 to 100
+ROOM = 'room'  # Owner of the aggregate over every student of a room
+
+# Layout of an aggregate vector
+COUNT, SUM, SUMSQ, EMA = range(4)
+HISTOGRAM = 4  # First of the HISTOGRAM_BUCKETS counts
+AGGREGATE_SIZE = HISTOGRAM + HISTOGRAM_BUCKETS
+
+
+def histogram_bucket(score):
+    """Get the histogram bucket of a score, out of range scores go to the edges"""
+    return max(0, min(HISTOGRAM_BUCKETS - 1, int(score * HISTOGRAM_BUCKETS // 100)))
+
+
+def update_aggregate(values, offset, score):
+    """Add a score to the aggregate vector starting at offset of values"""
+    values[offset + COUNT] += 1
+    values[offset + SUM] += score
+    values[offset + SUMSQ] += score * score
+    if values[offset + COUNT] == 1:
+        values[offset + EMA] = score
+    else:
+        values[offset + EMA] += (score - values[offset + EMA]) * EMA_ALPHA
+    values[offset + HISTOGRAM + histogram_bucket(score)] += 1
+
+
+def summarize_aggregate(vector):
+    """Turn an aggregate vector into count, mean, stddev, ema and histogram"""
+    count = int(vector[COUNT])
+    if not count:
+        return {'count': 0, 'mean': None, 'stddev': None, 'ema': None,
+                'histogram': [0] * HISTOGRAM_BUCKETS}
+    mean = vector[SUM] / count
+    # Rounding can leave a tiny negative variance for constant scores
+    variance = max(0.0, vector[SUMSQ] / count - mean * mean)
+    return {
+        'count': count,
+        'mean': round(mean, 2),
+        'stddev': round(math.sqrt(variance), 2),
+        'ema': round(vector[EMA], 2),
+        'histogram': [int(bucket) for bucket in vector[HISTOGRAM:HISTOGRAM + HISTOGRAM_BUCKETS]],
+    }
+
+
+class RoomAggregates:
+    """Aggregate vectors of a room and its students, packed into one array of doubles
+
+    Each owner, ROOM or a user id string, has AGGREGATE_SIZE consecutive
+    slots, so recording a score touches a fixed number of slots.
+    """
+
+    def __init__(self):
+        self._offsets = {}
+        self._values = array('d')
+
+    def _offset(self, owner):
+        offset = self._offsets.get(owner)
+        if offset is None:
+            offset = self._offsets[owner] = len(self._values)
+            self._values.extend([0.0] * AGGREGATE_SIZE)
+        return offset
+
+    def record(self, user_id, score):
+        """Add a score of a student to its aggregate and the room's"""
+        update_aggregate(self._values, self._offset(ROOM), score)
+        update_aggregate(self._values, self._offset(user_id), score)
+
+    def vectors(self):
+        """Get a copy of every aggregate vector, keyed by owner"""
+        return {
+            owner: self._values[offset:offset + AGGREGATE_SIZE].tolist()
+            for owner, offset in self._offsets.items()
+        }
+
+
+def summarize_room_aggregates(vectors):
+    """Build the summary block of a room from the vectors of a focus store"""
+    return {
+        'room': summarize_aggregate(vectors.get(ROOM, [0.0] * AGGREGATE_SIZE)),
+        'students': {
+            owner: summarize_aggregate(vector)
+            for owner, vector in vectors.items() if owner != ROOM
+        },
+    }
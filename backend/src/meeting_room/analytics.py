@@ -0,0 +1,173 @@
+import time
+from datetime import datetime, timezone
+import numpy as np
+from .models import CustomUser, FocusSample
+
+# Summary settings
+DEFAULT_WINDOW = 600  # Seconds of history summarized when no window is given
+MIN_WINDOW = 10
+MAX_WINDOW = 86400  # One day, bounds the samples loaded per summary
+LOW_FOCUS_THRESHOLD = 50  # Scores below this count as inattentive
+ROLLING_WINDOW = 60  # Seconds of the latest samples making a student's rolling mean
+MAX_SAMPLE_GAP = 60  # A sample holds for at most this long, longer gaps mean the student was away
+TIMELINE_BUCKETS = 30  # Points of the room's mean focus over the window
+MAX_DROP_EVENTS = 100  # Latest attention drops listed per summary
+PERCENTILES = (10, 50, 90)
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+def _round(value):
+    """Round a NumPy scalar for JSON, None for the NaN of an empty group"""
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def _group_mean(groups, values, mask, size):
+    """Mean of values per group over the masked samples, NaN for groups without any"""
+    counts = np.bincount(groups[mask], minlength=size)
+    sums = np.bincount(groups[mask], weights=values[mask], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def _group_percentiles(groups, values, size, percents):
+    """Percentiles of values per group, interpolated like np.percentile, NaN for empty groups
+
+    Sorting by (group, value) once lays every group out in order, so each
+    percentile is read at its fractional position within the group's slice.
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=size)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    empty = counts == 0
+    last = np.maximum(counts - 1, 0)
+
+    result = {}
+    for percent in percents:
+        position = offsets + last * (percent / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        if len(ordered):
+            low = np.minimum(low, len(ordered) - 1)
+            high = np.minimum(high, len(ordered) - 1)
+            value = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        else:
+            value = np.zeros(size)
+        result[percent] = np.where(empty, np.nan, value)
+    return result
+
+
+def load_focus_history(room_id, start):
+    """Load the samples of a room since start as arrays ordered by (user, ts)"""
+    rows = list(FocusSample.objects.filter(
+        room_id=room_id, ts__gte=datetime.fromtimestamp(start, tz=timezone.utc)
+    ).order_by('user_id', 'ts').values_list('user_id', 'ts', 'score', 'status'))
+    return {
+        'user_id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+        'ts': np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows)),
+        'score': np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows)),
+        'online': np.fromiter((row[3] == 'online' for row in rows), dtype=bool, count=len(rows)),
+    }
+
+
+def summarize_focus(history, start, end, threshold=LOW_FOCUS_THRESHOLD):
+    """Summarize samples ordered by (user, ts) between start and end
+
+    Each sample holds until the student's next one, at most MAX_SAMPLE_GAP
+    seconds. Only online samples count towards scores, an offline one just
+    ends the time held by the previous sample. An attention drop is an
+    online sample below the threshold following one at or above it.
+    """
+    users, inverse = np.unique(history['user_id'], return_inverse=True)
+    size = len(users)
+    ts, scores, online = history['ts'], history['score'], history['online']
+
+    # Samples are grouped by user, so the next sample of the same user is the next row
+    same_user_next = np.zeros(len(ts), dtype=bool)
+    same_user_next[:-1] = inverse[1:] == inverse[:-1]
+    next_ts = np.where(same_user_next, np.roll(ts, -1), end)
+    held = np.clip(np.minimum(next_ts, end) - ts, 0, MAX_SAMPLE_GAP)
+
+    below = online & (scores < threshold)
+    drops = np.zeros(len(ts), dtype=bool)
+    drops[1:] = below[1:] & ~below[:-1] & online[:-1] & (inverse[1:] == inverse[:-1])
+    recent = online & (ts >= end - ROLLING_WINDOW)
+
+    means = _group_mean(inverse, scores, online, size)
+    rolling = _group_mean(inverse, scores, recent, size)
+    percentiles = _group_percentiles(inverse[online], scores[online], size, PERCENTILES)
+    sample_counts = np.bincount(inverse[online], minlength=size)
+    time_below = np.bincount(inverse, weights=held * below, minlength=size)
+    drop_counts = np.bincount(inverse[drops], minlength=size)
+
+    # Room timeline, mean of all online samples per bucket of the window
+    bucket_size = (end - start) / TIMELINE_BUCKETS
+    buckets = np.clip(((ts - start) // bucket_size).astype(np.int64), 0, TIMELINE_BUCKETS - 1)
+    bucket_means = _group_mean(buckets, scores, online, TIMELINE_BUCKETS)
+    # Distinct (bucket, student) pairs give the students seen per bucket
+    pairs = np.unique(buckets[online] * max(size, 1) + inverse[online])
+    bucket_students = np.bincount(pairs // max(size, 1), minlength=TIMELINE_BUCKETS)
+
+    usernames = dict(CustomUser.objects.filter(id__in=users.tolist()).values_list('id', 'username'))
+    room_scores = scores[online]
+    drop_indexes = np.flatnonzero(drops)
+    drop_indexes = drop_indexes[np.argsort(ts[drop_indexes], kind='stable')][-MAX_DROP_EVENTS:]
+
+    return {
+        'window': round(end - start),
+        'start': _isoformat(start),
+        'end': _isoformat(end),
+        'threshold': threshold,
+        'room': {
+            'students': int(np.count_nonzero(sample_counts)),
+            'samples': int(len(room_scores)),
+            'mean': _round(room_scores.mean()) if len(room_scores) else None,
+            **{
+                f'p{percent}': _round(np.percentile(room_scores, percent)) if len(room_scores) else None
+                for percent in PERCENTILES
+            },
+            'time_below_threshold': round(float(time_below.sum()), 1),
+            'drops': int(drops.sum()),
+        },
+        'timeline': [
+            {
+                'start': _isoformat(start + bucket * bucket_size),
+                'mean': _round(bucket_means[bucket]),
+                'students': int(bucket_students[bucket]),
+            }
+            for bucket in range(TIMELINE_BUCKETS)
+        ],
+        'students': [
+            {
+                'user_id': int(user_id),
+                'username': usernames.get(int(user_id)),
+                'samples': int(sample_counts[index]),
+                'mean': _round(means[index]),
+                **{f'p{percent}': _round(percentiles[percent][index]) for percent in PERCENTILES},
+                'rolling_mean': _round(rolling[index]),
+                'time_below_threshold': round(float(time_below[index]), 1),
+                'drops': int(drop_counts[index]),
+            }
+            for index, user_id in enumerate(users)
+        ],
+        'drop_events': [
+            {
+                'user_id': int(users[inverse[index]]),
+                'username': usernames.get(int(users[inverse[index]])),
+                'timestamp': _isoformat(ts[index]),
+                'from': _round(scores[index - 1]),
+                'to': _round(scores[index]),
+            }
+            for index in drop_indexes
+        ],
+    }
+
+
+def get_focus_summary(room_id, window=DEFAULT_WINDOW):
+    """Summarize the focus history of a room over the last window seconds"""
+    end = time.time()
+    start = end - window
+    return summarize_focus(load_focus_history(room_id, start), start, end)
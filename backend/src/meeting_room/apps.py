@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MeetingRoomConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'meeting_room'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .caching import LRUCache
+from .models import CustomUser
+
+# Token cache settings, overridable through settings.TOKEN_AUTH_CACHE
+DEFAULT_MAX_ENTRIES = 10000  # Tokens kept in each process
+DEFAULT_TTL = 30  # Seconds a process trusts its own copy, bounds staleness across workers
+DEFAULT_SHARED_TTL = 300  # Seconds a token stays in the shared cache
+INVALIDATED_TTL = 10  # Seconds an invalidated token can't be cached again, covers lookups racing it
+INVALIDATED = 'invalidated'  # Shared cache value marking a token invalidated
+
+# Only these fields are cached and available on the lightweight user
+USER_FIELDS = ('id', 'username', 'email', 'role', 'is_active', 'is_staff', 'is_superuser')
+
+_config = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+token_cache = LRUCache(
+    _config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    _config.get('TTL', DEFAULT_TTL),
+)
+
+
+def get_cache_key(token_key):
+    """Generate cache key for the user record of a token"""
+    return f"auth_token_{token_key}"
+
+
+def user_from_record(record):
+    """Build a CustomUser carrying only the cached fields
+
+    It works for permission checks and as a foreign key value, but must never
+    be saved since every other field holds its default.
+    """
+    user = CustomUser(**record)
+    # Behave like a fetched row rather than one waiting to be inserted
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def get_cached_user(token_key):
+    """Resolve a token from the in-process cache only, never doing I/O"""
+    record = token_cache.get(token_key)
+    return user_from_record(record) if record is not None else None
+
+
+def get_user_for_token(token_key):
+    """Resolve a token to a lightweight user, None if the token does not exist"""
+    shared = _config.get('SHARED', True)
+    record = token_cache.get(token_key)
+    if record is None and shared:
+        record = cache.get(get_cache_key(token_key))
+        if record == INVALIDATED:
+            record = None
+        elif record is not None:
+            token_cache.set(token_key, record)
+
+    if record is None:
+        record = Token.objects.filter(key=token_key).values(
+            *(f'user__{field}' for field in USER_FIELDS)).first()
+        if record is None:
+            return None
+        record = {field: record[f'user__{field}'] for field in USER_FIELDS}
+        # add never replaces the mark of an invalidation that ran since the read
+        if not shared or cache.add(get_cache_key(token_key), record,
+                                   _config.get('SHARED_TTL', DEFAULT_SHARED_TTL)):
+            token_cache.set(token_key, record)
+
+    return user_from_record(record)
+
+
+def invalidate_token(token_key):
+    """Forget a token after it was deleted or its user changed
+
+    The shared entry is replaced by a short-lived mark rather than deleted,
+    so a lookup that read the token before the change can't cache it again.
+    """
+    token_cache.delete(token_key)
+    cache.set(get_cache_key(token_key), INVALIDATED, INVALIDATED_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF token authentication served from the token cache"""
+
+    def authenticate_credentials(self, key):
+        user = get_user_for_token(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from django.conf import settings
+from .codec import encode_event
+
+logger = logging.getLogger(__name__)
+
+# Coalescer settings, overridable through settings.DATA_BROADCAST
+DEFAULT_WINDOW_MS = 250  # Frames of a room received within this window leave as one batch
+DEFAULT_RATE = 10  # Frames per second a sender may keep up
+DEFAULT_BURST = 20  # Frames a sender may send at once above its rate
+DEFAULT_MAX_PENDING = 1000  # Frames a room may hold before new senders are dropped
+BUCKET_IDLE_TIMEOUT = 60  # Seconds after which an idle sender's rate limit is forgotten
+
+
+class TokenBucket:
+    """Rate limit of one sender, rate frames per second with bursts of burst frames"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class BroadcastCoalescer:
+    """Merge the data frames a room receives within a window into one data_batch event
+
+    Every frame a sender's rate limit lets through goes into the batch, in
+    order, so a room produces at most one group message per window instead
+    of one message per frame. Runs on the event loop of the worker. The
+    counters are kept per process and read through stats().
+    """
+
+    def __init__(self, window_ms=DEFAULT_WINDOW_MS, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, max_pending=DEFAULT_MAX_PENDING):
+        self.window = window_ms / 1000
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        # Group -> {'layer', 'frames': {user_id: [frame, ...]}, 'pending', 'task'}
+        self._rooms = {}
+        self._buckets = {}
+        self.counters = Counter()
+
+    async def add(self, channel_layer, group, user, data, timestamp=''):
+        """Queue a frame of a user for the group, return False if it was dropped"""
+        self.counters['received'] += 1
+
+        bucket = self._buckets.get((group, user.id))
+        if bucket is None:
+            bucket = self._buckets[(group, user.id)] = TokenBucket(self.rate, self.burst)
+        if not bucket.take():
+            self.counters['rate_limited'] += 1
+            return False
+
+        room = self._rooms.get(group)
+        if room is None:
+            room = self._rooms[group] = {
+                'layer': channel_layer, 'frames': {}, 'pending': 0, 'task': None}
+        if room['pending'] >= self.max_pending:
+            self.counters['dropped'] += 1
+            return False
+
+        # Senders' lists are bounded by their token buckets
+        room['frames'].setdefault(user.id, []).append({
+            'data': data,
+            'username': user.username,
+            'user_id': user.id,
+            'timestamp': timestamp
+        })
+        room['pending'] += 1
+        # A flush scheduled on a loop that is gone never runs, e.g. under async_to_sync
+        if room['task'] is None or room['task'].get_loop().is_closed():
+            room['task'] = asyncio.create_task(self._flush_later(group))
+        return True
+
+    async def _flush_later(self, group):
+        await asyncio.sleep(self.window)
+        await self.flush(group)
+
+    async def flush(self, group):
+        """Send the queued frames of a group as one data_batch event"""
+        room = self._rooms.pop(group, None)
+        if room is None or not room['frames']:
+            return
+
+        # Frames of one sender stay together and in order
+        frames = [frame for sender_frames in room['frames'].values() for frame in sender_frames]
+        try:
+            await room['layer'].group_send(group, encode_event('data_batch', frames=frames))
+            self.counters['batches'] += 1
+            self.counters['sent'] += len(frames)
+        except Exception as e:
+            self.counters['send_errors'] += 1
+            logger.error(f"Error broadcasting data batch to {group}: {str(e)}")
+        self._forget_idle_senders()
+
+    def _forget_idle_senders(self):
+        idle_since = time.monotonic() - BUCKET_IDLE_TIMEOUT
+        for key, bucket in list(self._buckets.items()):
+            if bucket.updated < idle_since:
+                del self._buckets[key]
+
+    def stats(self):
+        """Get the counters of this process and the number of rooms waiting to flush"""
+        return dict(self.counters, pending_rooms=len(self._rooms))
+
+
+def _create_coalescer():
+    config = getattr(settings, 'DATA_BROADCAST', {})
+    return BroadcastCoalescer(
+        window_ms=config.get('WINDOW_MS', DEFAULT_WINDOW_MS),
+        rate=config.get('RATE', DEFAULT_RATE),
+        burst=config.get('BURST', DEFAULT_BURST),
+        max_pending=config.get('MAX_PENDING', DEFAULT_MAX_PENDING)
+    )
+
+
+data_coalescer = _create_coalescer()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+
+# Single-flight settings
+BUILD_LOCK_TIMEOUT = 10  # Seconds before a crashed builder's lock expires
+BUILD_WAIT_INTERVAL = 0.05  # Seconds between two looks for the builder's value
+BUILD_MAX_WAIT = 2  # Seconds to wait for another builder before building anyway
+
+
+def get_generation_key(room_id, namespace='focus'):
+    """Generate cache key for a generation counter of a room"""
+    return f"{namespace}_generation_{room_id}"
+
+
+def get_room_generation(room_id, namespace='focus'):
+    """Get the current generation of a room's focus data or other namespace"""
+    key = get_generation_key(room_id, namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so an evicted counter never reuses an old generation
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_room_generation(room_id, namespace='focus'):
+    """Move a room to a new generation, making every cached read of it stale"""
+    try:
+        return cache.incr(get_generation_key(room_id, namespace))
+    except ValueError:
+        get_room_generation(room_id, namespace)
+        return cache.incr(get_generation_key(room_id, namespace))
+
+
+def get_or_build(key, build, timeout, stale_key=None):
+    """Get a cached value, letting only one caller build it when it is missing
+
+    Callers that lose the race serve the last value stored under stale_key,
+    i.e. the one built for an older generation, or wait for the winner.
+    Values of None are never cached.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}_lock"
+    if cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+        try:
+            value = build()
+            if value is not None:
+                cache.set(key, value, timeout)
+                if stale_key:
+                    cache.set(stale_key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    stale = cache.get(stale_key) if stale_key else None
+    if stale is not None:
+        return stale
+
+    deadline = time.monotonic() + BUILD_MAX_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_WAIT_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return build()
+
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
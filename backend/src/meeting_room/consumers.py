@@ -1,14 +1,50 @@
-import json
+import asyncio
+import logging
+from functools import partial
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from .models import Room, RoomParticipant
+from .models import RoomParticipant
+from .focus import (
+    room_group_name,
+    teacher_group_name,
+    student_group_name,
+    save_focus_sample,
+    save_focus_samples,
+    get_room_focus_rows,
+    focus_update_event
+)
+from .membership import get_room_members
+from .broadcast import data_coalescer
+from .executor import database_sync_to_async, db_executor
+from .stats import start_stats_logger
+from .codec import JSONDecodeError, dumps, encode_event, loads
+from .protocol import BINARY_SUBPROTOCOL, FRAME_SAMPLE, STATUS_CODES, decode_frame, encode_focus_rows
+from .presence import presence_store, presence_user, HEARTBEAT_INTERVAL
+from .serializers import FocusBatchSerializer
+
+logger = logging.getLogger(__name__)
+
+LOAD_SHED_CLOSE_CODE = 1013  # Try Again Later
+
+# Presence calls are Redis I/O, off the one thread shared by thread-sensitive calls
+presence_sync_to_async = partial(sync_to_async, thread_sensitive=False)
 
 
 class RoomConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.meeting_id = self.scope['url_route']['kwargs']['meeting_id']
-        self.room_group_name = f'room_{self.meeting_id}'
+        self.room_group_name = room_group_name(self.meeting_id)
+        self.teacher_group_name = teacher_group_name(self.meeting_id)
+        self.student_group_name = student_group_name(self.meeting_id)
         self.user = self.scope['user']
+        start_stats_logger()
+
+        # Shed new connections while database calls queue up, with 1013 Try Again Later
+        if self.scope.get('load_shed') or db_executor.should_shed():
+            db_executor.record_shed()
+            await self.accept()
+            await self.close(code=LOAD_SHED_CLOSE_CODE)
+            return
 
         if not self.user or not self.user.is_authenticated:
             await self.close()
@@ -25,49 +61,111 @@ class RoomConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        # Accept the connection
-        await self.accept()
+        # Telemetry only crosses between roles: students' frames and focus
+        # updates reach the teachers, teachers' frames reach the students
+        self.is_room_teacher = self.members['teacher_id'] == self.user.id
+        if self.is_room_teacher:
+            self.role_group_name = self.teacher_group_name
+            self.telemetry_group_name = self.student_group_name
+        else:
+            self.role_group_name = self.student_group_name
+            self.telemetry_group_name = self.teacher_group_name
+        await self.channel_layer.group_add(
+            self.role_group_name,
+            self.channel_name
+        )
 
-        # Get current participants
-        connected_users = await self.get_connected_users()
+        # Accept the connection, with compact binary focus frames if the client offers them
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+
+        # Send the current focus rows once, later changes arrive as focus_update
+        if self.is_room_teacher:
+            rows = await self.get_focus_rows()
+            if self.binary:
+                await self.send(bytes_data=encode_focus_rows(rows))
+            else:
+                await self.send(text_data=dumps({
+                    'type': 'focus_update',
+                    'data': rows
+                }))
+
+        # Register the connection, later joins and leaves arrive as events
+        first_connection = await presence_sync_to_async(presence_store.join)(
+            self.meeting_id, self.channel_name, presence_user(self.user))
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
 
         # Send current participants list to the new user
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'connected_users',
-            'users': connected_users
+            'users': await self.get_connected_users()
         }))
 
-        # Notify others that user has connected
+        # Notify others that user has connected, unless already present from another tab
+        if first_connection:
+            await self.send_user_connect(self.user.username, self.user.role)
+
+    async def get_connected_users(self):
+        """Get list of currently connected users in the room"""
+        users = await presence_sync_to_async(presence_store.snapshot)(self.meeting_id)
+        return [{'username': user['username'], 'role': user['role']} for user in users]
+
+    async def heartbeat(self):
+        """Keep this connection present and report connections that expired"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if not await presence_sync_to_async(presence_store.touch)(self.meeting_id, self.channel_name):
+                    # Pruned after a stall, register again
+                    if await presence_sync_to_async(presence_store.join)(
+                            self.meeting_id, self.channel_name, presence_user(self.user)):
+                        await self.send_user_connect(self.user.username, self.user.role)
+
+                # Connections of crashed workers never disconnect, they expire
+                for user in await presence_sync_to_async(presence_store.prune)(self.meeting_id):
+                    await self.send_user_disconnect(user['username'])
+            except Exception as e:
+                logger.error(f"Error refreshing presence of {self.user.username}: {str(e)}")
+
+    async def send_user_connect(self, username, role):
+        """Notify the room that a user is now present"""
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            encode_event(
+                'user_connect',
+                message=f'{username} has joined the room',
+                username=username,
+                role=role
+            )
+        )
+
+    async def send_user_disconnect(self, username):
+        """Notify the room that a user is no longer present"""
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'user_connect',
-                'message': f'{self.user.username} has joined the room',
-                'username': self.user.username,
-                'role': self.user.role
-            }
+            encode_event(
+                'user_disconnect',
+                message=f'{username} has left the room',
+                username=username
+            )
         )
 
     @database_sync_to_async
-    def get_connected_users(self):
-        """Get list of currently connected users in the room"""
-        try:
-            room = Room.objects.get(meeting_id=self.meeting_id)
-            participants = RoomParticipant.objects.filter(room=room)
-            return [{
-                'username': p.user.username,
-                'role': p.user.role
-            } for p in participants]
-        except Room.DoesNotExist:
-            return []
+    def get_focus_rows(self):
+        """Get the latest focus rows of every student in the room"""
+        return get_room_focus_rows(self.members['room_id'])
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await self.receive_frame(bytes_data)
+            return
 
-    async def receive(self, text_data):
         try:
-            data = json.loads(text_data)
+            data = loads(text_data)
             message_type = data.get('type', 'message')
             
-            # If it's an admin command
-            if message_type == 'admin_command' and await self.is_teacher():
+            # If it's an admin command, role was resolved at connect
+            if message_type == 'admin_command' and self.is_room_teacher:
                 await self.process_admin_command(data)
                 return
 
@@ -76,46 +174,84 @@ class RoomConsumer(AsyncWebsocketConsumer):
                 # Broadcast the chat message to the room
                 await self.channel_layer.group_send(
                     self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': data.get('message', ''),
-                        'username': self.user.username,
-                        'timestamp': data.get('timestamp', '')
-                    }
+                    encode_event(
+                        'chat_message',
+                        message=data.get('message', ''),
+                        username=self.user.username,
+                        timestamp=data.get('timestamp', '')
+                    )
                 )
             elif message_type == 'data':
-                # Send data message to the room
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'data_message',
-                        'data': data.get('data', {}),
-                        'username': self.user.username,
-                        'timestamp': data.get('timestamp', '')
-                    }
+                # Data frames leave merged with the room's others as one data_batch,
+                # to the other role only
+                await data_coalescer.add(
+                    self.channel_layer,
+                    self.telemetry_group_name,
+                    self.user,
+                    data.get('data', {}),
+                    data.get('timestamp', '')
                 )
-        except json.JSONDecodeError:
+            elif message_type == 'focus_update':
+                # Store the student's sample and push it to the teachers only
+                rows = await self.store_focus_data(
+                    data.get('focus_data'), data.get('status'))
+                await self.send_focus_rows(rows)
+            elif message_type == 'focus_batch':
+                # Store a batch of timestamped samples in one transaction
+                rows = await self.store_focus_batch(data.get('samples'))
+                await self.send_focus_rows(rows)
+        except JSONDecodeError:
             print(f"Invalid JSON received from {self.user.username}")
         except Exception as e:
             print(f"Error processing message from {self.user.username}: {str(e)}")
 
+    async def receive_frame(self, bytes_data):
+        """Store the focus samples of a binary frame and push them to the teachers"""
+        try:
+            kind, samples = decode_frame(bytes_data)
+        except ValueError as e:
+            logger.warning(f"Invalid binary frame received from {self.user.username}: {str(e)}")
+            return
+
+        try:
+            if kind == FRAME_SAMPLE:
+                rows = await self.store_focus_data(samples[0]['focus_data'], samples[0]['status'])
+            else:
+                rows = await self.store_focus_batch(samples)
+            await self.send_focus_rows(rows)
+        except Exception as e:
+            # Like receive, a failed store must not close the connection
+            logger.error(f"Error processing binary frame from {self.user.username}: {str(e)}")
+
+    async def send_focus_rows(self, rows):
+        """Push changed focus rows to the teachers of the room"""
+        if rows:
+            await self.channel_layer.group_send(
+                self.teacher_group_name,
+                focus_update_event(rows)
+            )
+
     async def disconnect(self, close_code):
+        # Rejected connections never joined the room
+        if not hasattr(self, 'heartbeat_task'):
+            return
+        self.heartbeat_task.cancel()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
-
-        # Notify others that user has disconnected
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_disconnect',
-                'message': f'{self.user.username} has left the room',
-                'username': self.user.username
-            }
+        await self.channel_layer.group_discard(
+            self.role_group_name,
+            self.channel_name
         )
 
+        # Notify others that user has disconnected, unless still present from another tab
+        user = await presence_sync_to_async(presence_store.leave)(self.meeting_id, self.channel_name)
+        if user:
+            await self.send_user_disconnect(user['username'])
+
     async def data_message(self, event):
         """Send data to WebSocket"""
         data = event['data']
@@ -123,42 +259,41 @@ class RoomConsumer(AsyncWebsocketConsumer):
         user_id = event.get('user_id', None)
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'data',
             'data': data,
             'username': username,
             'user_id': user_id
         }))
 
+    # Broadcast events carry their frame encoded once by the sender
+
+    async def data_batch(self, event):
+        """Send the data frames of a coalescing window to WebSocket"""
+        await self.send(text_data=event['text'])
+
+    async def focus_update(self, event):
+        """Send changed focus rows to a teacher dashboard"""
+        if self.binary:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
+
     async def user_connect(self, event):
         """Send user connected message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'user_connect',
-            'message': event['message'],
-            'username': event['username'],
-            'role': event['role']
-        }))
+        await self.send(text_data=event['text'])
 
     async def chat_message(self, event):
         """Send chat message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'username': event['username'],
-            'timestamp': event['timestamp']
-        }))
+        await self.send(text_data=event['text'])
 
     async def user_disconnect(self, event):
         """Send user disconnected message to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'user_disconnect',
-            'message': event['message'],
-            'username': event['username']
-        }))
+        await self.send(text_data=event['text'])
 
     async def admin_command_result(self, event):
         """Send command result to admin"""
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'command_result',
             'success': event['success'],
             'message': event['message'],
@@ -167,25 +302,54 @@ class RoomConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def is_valid_participant(self):
-        """Check if room exists and user is a participant"""
-        try:
-            room = Room.objects.get(meeting_id=self.meeting_id, is_active=True)
-            RoomParticipant.objects.get(room=room, user=self.user)
-            return True
-        except (Room.DoesNotExist, RoomParticipant.DoesNotExist):
-            return False
+        """Check if room exists and user is a participant, keeping the room's members"""
+        self.members = get_room_members(self.meeting_id)
+        return self.is_member()
+
+    def is_member(self):
+        """Check the members resolved at connect, or at the last membership change"""
+        return (
+            self.members is not None
+            and self.members['is_active']
+            and self.user.id in self.members['participant_ids']
+        )
+
+    async def membership_changed(self, event):
+        """Reload the room's members, closing the connection if the user lost their place"""
+        was_teacher = self.is_room_teacher
+        await self.is_valid_participant()
+        # Role groups were chosen at connect, a new role needs a new connection
+        if not self.is_member() or (self.members['teacher_id'] == self.user.id) != was_teacher:
+            await self.close()
 
     @database_sync_to_async
-    def is_teacher(self):
-        """Check if user is teacher for this room"""
+    def store_focus_data(self, focus_data, status):
+        """Store a focus sample sent by a student over the socket"""
+        if self.user.role != 'student' or focus_data is None or status not in STATUS_CODES:
+            return []
+        if not self.is_member():
+            return []
         try:
-            participant = RoomParticipant.objects.get(
-                room__meeting_id=self.meeting_id,
-                user=self.user
-            )
-            return participant.user.role == 'teacher'
-        except RoomParticipant.DoesNotExist:
-            return False
+            row = save_focus_sample(
+                self.members['room_id'], self.members['name'], self.user, focus_data, status)
+        except (ValueError, TypeError):
+            return []
+        return [row]
+
+    @database_sync_to_async
+    def store_focus_batch(self, samples):
+        """Store a batch of focus samples sent by a student over the socket"""
+        if self.user.role != 'student':
+            return []
+        serializer = FocusBatchSerializer(data={'samples': samples})
+        if not serializer.is_valid():
+            return []
+        if not self.is_member():
+            return []
+        row = save_focus_samples(
+            self.members['room_id'], self.members['name'], self.user,
+            serializer.validated_data['samples'])
+        return [row]
 
     # @database_sync_to_async
     # def store_data_stream(self, data):
@@ -210,7 +374,7 @@ class RoomConsumer(AsyncWebsocketConsumer):
                 success, message = await self.kick_user(user_id)
 
                 # Send result back to admin
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=dumps({
                     'type': 'command_result',
                     'success': success,
                     'message': message,
@@ -221,15 +385,24 @@ class RoomConsumer(AsyncWebsocketConsumer):
     def kick_user(self, user_id):
         """Admin command to remove a user from the room"""
         try:
-            room = Room.objects.get(id=self.meeting_id)
-            participant = RoomParticipant.objects.get(
-                room=room, user_id=user_id)
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return False, "User not found in this room"
 
-            # Don't allow kicking other admins
-            if participant.role == 'teacher':
-                return False, "Cannot kick another teacher"
+        # Members resolved at connect, refreshed on every membership change
+        if user_id not in self.members['participant_ids']:
+            return False, "User not found in this room"
 
-            participant.delete()
-            return True, f"User {participant.user.username} has been kicked"
-        except (Room.DoesNotExist, RoomParticipant.DoesNotExist):
+        # Don't allow kicking the teacher
+        if user_id == self.members['teacher_id']:
+            return False, "Cannot kick another teacher"
+
+        try:
+            participant = RoomParticipant.objects.select_related('user').get(
+                room_id=self.members['room_id'], user_id=user_id)
+        except RoomParticipant.DoesNotExist:
             return False, "User not found in this room"
+
+        # The participant signal refreshes the membership cache
+        participant.delete()
+        return True, f"User {participant.user.username} has been kicked"
@@ -0,0 +1,87 @@
+import time
+from functools import wraps
+from hashlib import md5
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .caching import get_room_generation, get_or_build
+from .codec import dumps_bytes
+from .membership import get_room_members
+
+# Response cache settings
+RESPONSE_CACHE_TIMEOUT = 60  # Cache for 1 minute, generations make older entries unreachable
+
+
+def get_response_cache_key(name, room_id, variant, generation):
+    """Generate cache key for a cached read response of a view"""
+    return f"response_body_{name}_{room_id}_{variant}_{generation}"
+
+
+def cache_room_response(namespace, period=None):
+    """Cache a room read view per (room, role, generation) and answer If-None-Match
+
+    The namespace picks the generation, views sharing one are still cached
+    apart under their own names. The view takes meeting_id and is cached
+    only when it answers 200. The JSON body is encoded once per generation
+    and served as is on every hit. Clients sending back the ETag of a cached
+    200 of the current generation get an empty 304. Views whose body moves
+    with the clock pass period, the seconds after which it is rebuilt even
+    without writes.
+    """
+    def decorator(view):
+        name = view.__name__
+
+        @wraps(view)
+        def wrapper(request, meeting_id, *args, **kwargs):
+            members = get_room_members(meeting_id)
+            if members is None:
+                return view(request, meeting_id, *args, **kwargs)
+
+            room_id = members['room_id']
+            # Query parameters such as since select a different payload
+            variant = request.user.role
+            query = request.GET.urlencode()
+            if query:
+                variant = f"{variant}-{md5(query.encode()).hexdigest()}"
+            generation = get_room_generation(room_id, namespace)
+            if period:
+                generation = f"{generation}-{int(time.time() // period)}"
+            etag = quote_etag(f"{name}-{room_id}-{variant}-{generation}")
+            key = get_response_cache_key(name, room_id, variant, generation)
+
+            # Only 200s are cached, an entry means the view let this variant through
+            if (etag in parse_etags(request.headers.get('If-None-Match', ''))
+                    and cache.get(key) is not None):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = None
+
+                def build():
+                    nonlocal response
+                    response = view(request, meeting_id, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return None
+                    return {'etag': etag, 'body': dumps_bytes(response.data, JSONEncoder().default)}
+
+                # A stale entry keeps the ETag of its own generation
+                cached = get_or_build(
+                    key,
+                    build,
+                    RESPONSE_CACHE_TIMEOUT,
+                    stale_key=get_response_cache_key(name, room_id, variant, 'latest')
+                )
+                if cached is None:
+                    return response
+                etag = cached['etag']
+                response = HttpResponse(cached['body'], content_type='application/json')
+
+            response['ETag'] = etag
+            # Let clients keep the body but revalidate on every poll
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
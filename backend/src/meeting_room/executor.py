@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+# Executor settings, overridable through settings.DB_EXECUTOR
+DEFAULT_MAX_WORKERS = 8  # Threads, and so database connections, of a worker process
+DEFAULT_MAX_QUEUE = 200  # Waiting calls above which new connections are shed
+DEFAULT_SHED_WAIT_MS = 500  # Wait for a thread above which new connections are shed
+WAIT_SMOOTHING = 0.2  # Weight of the latest wait in the moving average
+
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """Thread pool recording how many calls wait for a thread and for how long
+
+    Waiting calls are kept in submission order, the first one is the oldest.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE,
+                 shed_wait_ms=DEFAULT_SHED_WAIT_MS):
+        super().__init__(max_workers=max_workers, thread_name_prefix='db-executor')
+        self.max_queue = max_queue
+        self.shed_wait = shed_wait_ms / 1000 if shed_wait_ms is not None else None
+        self._lock = threading.Lock()
+        # Token of each waiting call -> submission time
+        self._waiting = {}
+        self.running = 0
+        self.wait_average = 0.0
+        self.wait_max = 0.0
+        self.counters = Counter()
+
+    def submit(self, fn, *args, **kwargs):
+        token = object()
+        with self._lock:
+            self._waiting[token] = time.monotonic()
+            self.counters['submitted'] += 1
+
+        def run():
+            with self._lock:
+                wait = time.monotonic() - self._waiting.pop(token)
+                self.running += 1
+                self.wait_average += (wait - self.wait_average) * WAIT_SMOOTHING
+                self.wait_max = max(self.wait_max, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.counters['completed'] += 1
+
+        future = super().submit(run)
+        # A call cancelled before it got a thread must not count as waiting forever
+        future.add_done_callback(lambda f: f.cancelled() and self._forget(token))
+        return future
+
+    def _forget(self, token):
+        with self._lock:
+            self._waiting.pop(token, None)
+
+    def should_shed(self):
+        """Check if new connections should be refused to let queued calls drain"""
+        if self.shed_wait is None:
+            return False
+        with self._lock:
+            queued = len(self._waiting)
+            oldest = next(iter(self._waiting.values()), None)
+            wait = time.monotonic() - oldest if oldest is not None else 0.0
+            average = self.wait_average
+        # An idle pool never sheds, however slow the last calls were. The oldest
+        # wait covers the average's lag when no call got a thread for a while
+        return queued > self.max_queue or (queued > 0 and max(wait, average) > self.shed_wait)
+
+    def record_shed(self):
+        with self._lock:
+            self.counters['shed'] += 1
+
+    def stats(self):
+        """Get the queue depth, waits in milliseconds and counters of this process"""
+        with self._lock:
+            return dict(
+                self.counters,
+                max_workers=self._max_workers,
+                queued=len(self._waiting),
+                running=self.running,
+                wait_average_ms=self.wait_average * 1000,
+                wait_max_ms=self.wait_max * 1000,
+            )
+
+
+def _create_executor():
+    config = getattr(settings, 'DB_EXECUTOR', {})
+    return InstrumentedExecutor(
+        max_workers=config.get('MAX_WORKERS', DEFAULT_MAX_WORKERS),
+        max_queue=config.get('MAX_QUEUE', DEFAULT_MAX_QUEUE),
+        shed_wait_ms=config.get('SHED_WAIT_MS', DEFAULT_SHED_WAIT_MS)
+    )
+
+
+db_executor = _create_executor()
+
+
+class BoundedDatabaseSyncToAsync(DatabaseSyncToAsync):
+    """channels' database_sync_to_async running on db_executor
+
+    Calls run on a fixed number of threads instead of queueing on the one
+    thread shared by every thread-sensitive call of the process.
+    """
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False, executor=db_executor)
+
+
+# Drop-in replacement, used as a decorator like channels' own
+database_sync_to_async = BoundedDatabaseSyncToAsync
@@ -0,0 +1,156 @@
+import csv
+from itertools import islice
+from asgiref.sync import sync_to_async
+from .models import DataStream, FocusRollup, FocusSample
+from .rollup import HOUR, MINUTE
+
+# Export settings
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched from the database and written per chunk
+
+# Column types: int, float, str and datetime
+DATASETS = {
+    # Every raw sample still kept
+    'history': (
+        [('user_id', 'int'), ('username', 'str'), ('ts', 'datetime'),
+         ('score', 'float'), ('status', 'str')],
+        lambda room_id: FocusSample.objects.filter(room_id=room_id).order_by('ts').values_list(
+            'user_id', 'user__username', 'ts', 'score', 'status')
+    ),
+    # The latest value of every student
+    'latest': (
+        [('user_id', 'int'), ('username', 'str'), ('timestamp', 'datetime'),
+         ('focus_data', 'float'), ('status', 'str')],
+        lambda room_id: DataStream.objects.filter(room_id=room_id).order_by('user_id').values_list(
+            'user_id', 'user__username', 'timestamp', 'focus_data', 'status')
+    ),
+    # Compacted history, see meeting_room.rollup
+    'minute': (
+        [('user_id', 'int'), ('username', 'str'), ('bucket', 'datetime'),
+         ('count', 'int'), ('min', 'float'), ('max', 'float'), ('mean', 'float')],
+        lambda room_id: _rollups(room_id, MINUTE)
+    ),
+    'hour': (
+        [('user_id', 'int'), ('username', 'str'), ('bucket', 'datetime'),
+         ('count', 'int'), ('min', 'float'), ('max', 'float'), ('mean', 'float')],
+        lambda room_id: _rollups(room_id, HOUR)
+    ),
+}
+
+
+def _rollups(room_id, resolution):
+    return FocusRollup.objects.filter(
+        room_id=room_id, resolution=resolution
+    ).order_by('bucket', 'user_id').values_list(
+        'user_id', 'user__username', 'bucket', 'count', 'min', 'max', 'mean')
+
+
+def iter_chunks(rows, size=EXPORT_CHUNK_SIZE):
+    """Split an iterable of rows into lists of at most size rows"""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+class _Pending:
+    """Write target collecting what a writer produced until it is taken"""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(data)
+        return len(data)
+
+    def take(self):
+        parts, self._parts = self._parts, []
+        return parts
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class CsvExportWriter:
+    """Write rows as CSV with a header line, always available"""
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def write(self, columns, chunks):
+        pending = _Pending()
+        writer = csv.writer(pending)
+        writer.writerow([name for name, _ in columns])
+        datetimes = [index for index, (_, kind) in enumerate(columns) if kind == 'datetime']
+        for chunk in chunks:
+            for row in chunk:
+                if datetimes:
+                    row = list(row)
+                    for index in datetimes:
+                        row[index] = row[index].isoformat()
+                writer.writerow(row)
+            yield ''.join(pending.take())
+        # An empty export is still a header line
+        yield ''.join(pending.take())
+
+
+class ParquetExportWriter:
+    """Write rows as Parquet, one row group per chunk, needs pyarrow"""
+    content_type = 'application/vnd.apache.parquet'
+    extension = 'parquet'
+
+    def __init__(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        self._pa = pyarrow
+        self._parquet = pyarrow.parquet
+
+    def _schema(self, columns):
+        pa = self._pa
+        types = {
+            'int': pa.int64(),
+            'float': pa.float64(),
+            'str': pa.string(),
+            'datetime': pa.timestamp('us', tz='UTC'),
+        }
+        return pa.schema([(name, types[kind]) for name, kind in columns])
+
+    def write(self, columns, chunks):
+        schema = self._schema(columns)
+        pending = _Pending()
+        writer = self._parquet.ParquetWriter(pending, schema)
+        for chunk in chunks:
+            # Rows to columns, pyarrow converts each column at C speed
+            arrays = [list(column) for column in zip(*chunk)]
+            writer.write_table(self._pa.Table.from_arrays(arrays, schema=schema))
+            yield b''.join(pending.take())
+        writer.close()
+        yield b''.join(pending.take())
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'parquet': ParquetExportWriter,
+}
+
+
+def export_room(room_id, dataset, writer):
+    """Stream a dataset of a room through a writer, holding one chunk in memory at a time"""
+    columns, queryset = DATASETS[dataset]
+    rows = queryset(room_id).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return (part for part in writer.write(columns, iter_chunks(rows)) if part)
+
+
+async def aiter_sync(iterator):
+    """Consume a sync iterator from async code one item at a time
+
+    ASGI servers read a sync StreamingHttpResponse into memory at once, this
+    keeps streaming. Items come from one thread, so the database cursor of
+    the iterator stays on its connection.
+    """
+    sentinel = object()
+    next_item = sync_to_async(lambda: next(iterator, sentinel))
+    while (item := await next_item()) is not sentinel:
+        yield item
@@ -0,0 +1,233 @@
+import logging
+from datetime import timezone as dt_timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from .models import DataStream, FocusSample
+from .ingest import focus_sample_buffer
+from .focus_store import focus_store, start_focus_flusher
+from .rollup import start_rollup_scheduler
+from .snapshot import load_room_snapshot
+from .aggregates import summarize_room_aggregates
+from .caching import bump_room_generation
+from .codec import encode_event
+from .protocol import encode_focus_rows
+from .serializers import DataStreamSerializer
+
+logger = logging.getLogger(__name__)
+
+_timestamp_field = serializers.DateTimeField()
+
+CURSOR_NAMESPACE = 'focus_cursor'  # Generation counter numbering the writes of each room
+
+
+def room_group_name(meeting_id):
+    """Channel group every connection of a room belongs to"""
+    return f'room_{meeting_id}'
+
+
+def teacher_group_name(meeting_id):
+    """Channel group only the teacher dashboards of a room belong to"""
+    return f'room_{meeting_id}_teachers'
+
+
+def student_group_name(meeting_id):
+    """Channel group only the student connections of a room belong to"""
+    return f'room_{meeting_id}_students'
+
+
+def serialize_focus_rows(data_streams):
+    """Serialize DataStream rows into plain, channel-layer safe dicts"""
+    rows = DataStreamSerializer(data_streams, many=True).data
+    for item in rows:
+        item['room'] = str(item['room'])
+        item['user'] = str(item['user'])
+    return rows
+
+
+def focus_row(data_stream, room_name):
+    """Serialize one DataStream like serialize_focus_rows without touching the room"""
+    return {
+        'room': str(data_stream.room_id),
+        'room_name': room_name,
+        'user': str(data_stream.user_id),
+        'username': data_stream.user.username,
+        'focus_data': data_stream.focus_data,
+        'status': data_stream.status,
+        'timestamp': _timestamp_field.to_representation(data_stream.timestamp),
+    }
+
+
+def save_focus_sample(room_id, room_name, user, focus_data, status):
+    """Write the latest focus sample of a student behind to the focus store"""
+    data_stream = DataStream(
+        room_id=room_id,
+        user=user,
+        focus_data=float(focus_data),
+        status=status,
+        timestamp=timezone.now()
+    )
+    row = focus_row(data_stream, room_name)
+    # Numbered before the put, a poll that misses the entry returns a lower cursor
+    cursor = bump_room_generation(room_id, CURSOR_NAMESPACE)
+
+    # No database access, the flusher upserts dirty entries into DataStream
+    focus_store.put(room_id, user.id, [data_stream.timestamp.timestamp(), row, cursor])
+    if data_stream.status == 'online':
+        focus_store.record_scores(room_id, user.id, [data_stream.focus_data])
+    start_focus_flusher()
+    start_rollup_scheduler()
+    bump_room_generation(room_id)
+
+    # DataStream only keeps the latest value, the buffer appends the history
+    focus_sample_buffer.add(FocusSample(
+        room_id=room_id,
+        user=user,
+        ts=data_stream.timestamp,
+        score=data_stream.focus_data,
+        status=data_stream.status
+    ))
+    return row
+
+
+def save_focus_samples(room_id, room_name, user, samples):
+    """Store a validated, timestamp-ordered batch of samples in one transaction"""
+    # History keeps the client timestamps, written directly instead of buffered
+    with transaction.atomic():
+        FocusSample.objects.bulk_create([
+            FocusSample(
+                room_id=room_id,
+                user=user,
+                ts=sample['timestamp'],
+                score=sample['focus_data'],
+                status=sample['status']
+            )
+            for sample in samples
+        ])
+
+    # Only the newest sample of the batch becomes the latest value
+    latest = samples[-1]
+    data_stream = DataStream(
+        room_id=room_id,
+        user=user,
+        focus_data=latest['focus_data'],
+        status=latest['status'],
+        timestamp=timezone.now()
+    )
+    row = focus_row(data_stream, room_name)
+    cursor = bump_room_generation(room_id, CURSOR_NAMESPACE)
+    focus_store.put(room_id, user.id, [data_stream.timestamp.timestamp(), row, cursor])
+    focus_store.record_scores(room_id, user.id, [
+        sample['focus_data'] for sample in samples if sample['status'] == 'online'
+    ])
+    start_focus_flusher()
+    start_rollup_scheduler()
+    bump_room_generation(room_id)
+    return row
+
+
+def get_room_focus_entries(room_id):
+    """Get the [timestamp, row, cursor] entry of every student in a room, keyed by user id"""
+    entries = focus_store.get_room(room_id)
+    if entries is None:
+        # First read of the room in this store, seed it from the room's snapshot
+        rows = load_room_snapshot(room_id)
+        if rows is None:
+            # Nothing flushed since snapshots exist, the first flush creates one
+            data_streams = DataStream.objects.filter(
+                room_id=room_id).select_related('room', 'user')
+            rows = {
+                data_stream.user_id: [data_stream.timestamp.timestamp(), row]
+                for data_stream, row in zip(data_streams, serialize_focus_rows(data_streams))
+            }
+        # Rows already stored only count as changed for pollers that started before them
+        entries = focus_store.load_room(room_id, {
+            user_id: [timestamp, row, to_cursor(timestamp)]
+            for user_id, (timestamp, row) in rows.items()
+        })
+    return entries
+
+
+def get_room_focus_rows(room_id):
+    """Get the latest focus row of every student in a room, newest first"""
+    entries = get_room_focus_entries(room_id).values()
+    return [entry[1] for entry in sorted(entries, key=lambda entry: entry[0], reverse=True)]
+
+
+def to_cursor(timestamp):
+    """Convert a POSIX timestamp into a focus cursor, microseconds since the epoch"""
+    return round(timestamp * 1_000_000)
+
+
+def entry_cursor(entry):
+    """Get the cursor of a store entry, entries stored before cursors fall back to their timestamp"""
+    return entry[2] if len(entry) > 2 else to_cursor(entry[0])
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp parameter, naive ones are UTC"""
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError(f"Invalid timestamp: {value}")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    return timestamp
+
+
+def parse_focus_cursor(value):
+    """Parse a since parameter given as a cursor or an ISO 8601 timestamp"""
+    if not value:
+        return 0
+    if value.isdigit():
+        return int(value)
+    return to_cursor(parse_timestamp(value).timestamp())
+
+
+def get_room_focus_changes(room_id, since=0):
+    """Get the rows of a room that changed after the since cursor, and the new cursor
+
+    Cursors number the writes of a room, not their clocks, so a row stamped
+    before a poll but stored after it is still newer than that poll's cursor.
+    The counter starts from the clock in microseconds, which keeps ISO 8601
+    since parameters roughly comparable.
+    """
+    # A room not loaded in the store costs one snapshot lookup
+    entries = get_room_focus_entries(room_id)
+    changed = [entry for entry in entries.values() if entry_cursor(entry) > since]
+    rows = [entry[1] for entry in sorted(changed, key=lambda entry: entry[0], reverse=True)]
+    return rows, max([since] + [entry_cursor(entry) for entry in entries.values()])
+
+
+def get_room_focus_summary(room_id):
+    """Get the running aggregates of a room and its students, kept up to date on every save
+
+    Only online samples count, the averages cover every sample since the
+    room was first written to the focus store.
+    """
+    return summarize_room_aggregates(focus_store.get_aggregates(room_id))
+
+
+def focus_update_event(rows):
+    """Build the focus_update group event, encoded once for text and binary dashboards"""
+    event = encode_event('focus_update', data=rows)
+    event['bytes'] = encode_focus_rows(rows)
+    return event
+
+
+def broadcast_focus_update(meeting_id, rows):
+    """Push changed focus rows to the teacher dashboards of a room"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not rows:
+        return
+
+    try:
+        async_to_sync(channel_layer.group_send)(
+            teacher_group_name(meeting_id),
+            focus_update_event(rows)
+        )
+    except Exception as e:
+        # A failed push must never fail the write, dashboards catch up on reconnect
+        logger.error(f"Error broadcasting focus update: {str(e)}")
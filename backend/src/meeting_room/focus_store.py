@@ -0,0 +1,297 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import OperationalError, close_old_connections
+from django.utils.module_loading import import_string
+from .aggregates import AGGREGATE_SIZE, EMA_ALPHA, HISTOGRAM, ROOM, RoomAggregates, histogram_bucket
+from .codec import dumps_bytes, loads
+from .models import DataStream
+from .snapshot import update_room_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Store settings, overridable through settings.FOCUS_STORE
+DEFAULT_BACKEND = 'meeting_room.focus_store.LocalFocusStore'
+DEFAULT_FLUSH_INTERVAL = 2  # Seconds between two writes of dirty entries to DataStream
+ROOM_TIMEOUT = 60 * 60 * 24  # Forget rooms nobody wrote to for a day
+
+# Adds scores to the aggregate slots of the room and each student atomically,
+# fields are "<owner>:<slot>" with the slots of meeting_room.aggregates
+RECORD_SCORES_SCRIPT = """
+local alpha = tonumber(ARGV[1])
+for i = 4, #ARGV, 3 do
+    local score = tonumber(ARGV[i + 1])
+    for _, owner in ipairs({ARGV[3], ARGV[i]}) do
+        local count = redis.call('HINCRBY', KEYS[1], owner .. ':0', 1)
+        redis.call('HINCRBYFLOAT', KEYS[1], owner .. ':1', score)
+        redis.call('HINCRBYFLOAT', KEYS[1], owner .. ':2', score * score)
+        local ema = score
+        if count > 1 then
+            ema = tonumber(redis.call('HGET', KEYS[1], owner .. ':3'))
+            ema = ema + (score - ema) * alpha
+        end
+        redis.call('HSET', KEYS[1], owner .. ':3', string.format('%.17g', ema))
+        redis.call('HINCRBY', KEYS[1], owner .. ':' .. ARGV[i + 2], 1)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+
+class LocalFocusStore:
+    """In-process store of the latest focus row per user, for tests and single workers
+
+    Entries are [timestamp, row, cursor] lists keyed by room id and user id,
+    both strings, where timestamp is a POSIX float, row the serialized
+    DataStream row served to dashboards and cursor the write's number in
+    its room.
+    """
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._dirty = {}
+        self._aggregates = {}
+        # Rooms seeded through load_room, writes alone don't make a room complete
+        self._loaded = set()
+
+    def put(self, room_id, user_id, entry):
+        """Store the latest entry of a user and mark it for flushing"""
+        room_id, user_id = str(room_id), str(user_id)
+        with self._lock:
+            self._rooms.setdefault(room_id, {})[user_id] = entry
+            self._dirty.setdefault(room_id, set()).add(user_id)
+
+    def get_room(self, room_id):
+        """Get every entry of a room, None if the room was never loaded"""
+        room_id = str(room_id)
+        with self._lock:
+            if room_id not in self._loaded:
+                return None
+            return dict(self._rooms.get(room_id, {}))
+
+    def load_room(self, room_id, entries):
+        """Seed a room from the database without overwriting newer entries"""
+        with self._lock:
+            room = self._rooms.setdefault(str(room_id), {})
+            for user_id, entry in entries.items():
+                room.setdefault(str(user_id), entry)
+            self._loaded.add(str(room_id))
+            return dict(room)
+
+    def pop_dirty(self):
+        """Take the entries written since the last call, grouped by room"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            return {
+                room_id: {user_id: self._rooms[room_id][user_id] for user_id in user_ids}
+                for room_id, user_ids in dirty.items()
+                if room_id in self._rooms
+            }
+
+    def mark_dirty(self, room_id, user_ids):
+        """Flush the entries of these users again with the next pop_dirty"""
+        with self._lock:
+            self._dirty.setdefault(str(room_id), set()).update(str(user_id) for user_id in user_ids)
+
+    def record_scores(self, room_id, user_id, scores):
+        """Add scores of a user to the running aggregates of the user and the room"""
+        with self._lock:
+            aggregates = self._aggregates.get(str(room_id))
+            if aggregates is None:
+                aggregates = self._aggregates[str(room_id)] = RoomAggregates()
+            for score in scores:
+                aggregates.record(str(user_id), score)
+
+    def get_aggregates(self, room_id):
+        """Get the aggregate vectors of a room keyed by ROOM and user id"""
+        with self._lock:
+            aggregates = self._aggregates.get(str(room_id))
+            return aggregates.vectors() if aggregates is not None else {}
+
+
+class RedisFocusStore:
+    """Redis store of the latest focus row per user, shared by every worker"""
+
+    def __init__(self, LOCATION='redis://127.0.0.1:6379', **options):
+        import redis
+
+        self._redis = redis.Redis.from_url(LOCATION)
+        self._record_scores = self._redis.register_script(RECORD_SCORES_SCRIPT)
+
+    def room_key(self, room_id):
+        return f"focus_store:room:{room_id}"
+
+    def loaded_key(self, room_id):
+        return f"focus_store:loaded:{room_id}"
+
+    def dirty_key(self, room_id):
+        return f"focus_store:dirty:{room_id}"
+
+    def aggregates_key(self, room_id):
+        return f"focus_store:aggregates:{room_id}"
+
+    dirty_rooms_key = 'focus_store:dirty_rooms'
+
+    def put(self, room_id, user_id, entry):
+        """Store the latest entry of a user and mark it for flushing"""
+        room_key = self.room_key(room_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(room_key, str(user_id), dumps_bytes(entry))
+        pipe.expire(room_key, ROOM_TIMEOUT)
+        pipe.sadd(self.dirty_key(room_id), str(user_id))
+        pipe.sadd(self.dirty_rooms_key, str(room_id))
+        pipe.execute()
+
+    def get_room(self, room_id):
+        """Get every entry of a room, None if the room was never loaded"""
+        pipe = self._redis.pipeline()
+        pipe.exists(self.loaded_key(room_id))
+        pipe.hgetall(self.room_key(room_id))
+        loaded, entries = pipe.execute()
+        if not loaded:
+            return None
+        return {user_id.decode(): loads(entry) for user_id, entry in entries.items()}
+
+    def load_room(self, room_id, entries):
+        """Seed a room from the database without overwriting newer entries"""
+        room_key = self.room_key(room_id)
+        pipe = self._redis.pipeline()
+        for user_id, entry in entries.items():
+            pipe.hsetnx(room_key, str(user_id), dumps_bytes(entry))
+        pipe.expire(room_key, ROOM_TIMEOUT)
+        pipe.set(self.loaded_key(room_id), 1, ex=ROOM_TIMEOUT)
+        pipe.execute()
+        return self.get_room(room_id)
+
+    def pop_dirty(self):
+        """Take the entries written since the last call, grouped by room"""
+        dirty = {}
+        # SPOP is atomic, so concurrent flushers never write the same entry twice
+        for room_id in self._redis.spop(self.dirty_rooms_key, self._redis.scard(self.dirty_rooms_key)) or []:
+            room_id = room_id.decode()
+            dirty_key = self.dirty_key(room_id)
+            user_ids = self._redis.spop(dirty_key, self._redis.scard(dirty_key)) or []
+            if not user_ids:
+                continue
+            entries = self._redis.hmget(self.room_key(room_id), user_ids)
+            dirty[room_id] = {
+                user_id.decode(): loads(entry)
+                for user_id, entry in zip(user_ids, entries)
+                if entry is not None
+            }
+        return dirty
+
+    def mark_dirty(self, room_id, user_ids):
+        """Flush the entries of these users again with the next pop_dirty"""
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return
+        pipe = self._redis.pipeline()
+        pipe.sadd(self.dirty_key(room_id), *user_ids)
+        pipe.sadd(self.dirty_rooms_key, str(room_id))
+        pipe.execute()
+
+    def record_scores(self, room_id, user_id, scores):
+        """Add scores of a user to the running aggregates of the user and the room"""
+        if not scores:
+            return
+        args = [EMA_ALPHA, ROOM_TIMEOUT, ROOM]
+        for score in scores:
+            args += [str(user_id), score, HISTOGRAM + histogram_bucket(score)]
+        self._record_scores(keys=[self.aggregates_key(room_id)], args=args)
+
+    def get_aggregates(self, room_id):
+        """Get the aggregate vectors of a room keyed by ROOM and user id"""
+        vectors = {}
+        for field, value in self._redis.hgetall(self.aggregates_key(room_id)).items():
+            owner, slot = field.decode().rsplit(':', 1)
+            vectors.setdefault(owner, [0.0] * AGGREGATE_SIZE)[int(slot)] = float(value)
+        return vectors
+
+
+def flush_focus_store(store):
+    """Persist the dirty entries of a store to DataStream and the room snapshots in bulk"""
+    for room_id, entries in store.pop_dirty().items():
+        data_streams = [
+            DataStream(
+                room_id=room_id,
+                user_id=int(user_id),
+                focus_data=entry[1]['focus_data'],
+                status=entry[1]['status']
+            )
+            for user_id, entry in entries.items()
+        ]
+        try:
+            DataStream.objects.bulk_create(
+                data_streams,
+                update_conflicts=True,
+                unique_fields=['room', 'user'],
+                update_fields=['focus_data', 'status', 'timestamp']
+            )
+            # Cold dashboard reads are served from the snapshot, keep it in step
+            update_room_snapshot(room_id, entries)
+        except OperationalError as e:
+            # E.g. a locked database, the next flush writes the then latest entries
+            store.mark_dirty(room_id, entries)
+            logger.error(f"Error flushing focus data of room {room_id}, retrying: {str(e)}")
+        except Exception as e:
+            # Drop the room's batch rather than the other rooms' flushes
+            logger.error(f"Error flushing focus data of room {room_id}, dropped its batch: {str(e)}")
+
+
+class FocusFlusher(threading.Thread):
+    """Background thread writing dirty store entries to DataStream on an interval"""
+
+    def __init__(self, store, interval):
+        super().__init__(name='focus-flusher', daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                flush_focus_store(self.store)
+            except Exception as e:
+                logger.error(f"Error flushing focus store: {str(e)}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+def _create_store():
+    config = getattr(settings, 'FOCUS_STORE', {})
+    options = {key: value for key, value in config.items()
+               if key not in ('BACKEND', 'FLUSH_INTERVAL')}
+    return import_string(config.get('BACKEND', DEFAULT_BACKEND))(**options)
+
+
+focus_store = _create_store()
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_focus_flusher():
+    """Start the background flusher of this process once"""
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            interval = getattr(settings, 'FOCUS_STORE', {}).get(
+                'FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+            _flusher = FocusFlusher(focus_store, interval)
+            _flusher.start()
+            # Persist what is still dirty on shutdown, only processes that wrote have any
+            atexit.register(_flush_on_exit)
+
+
+def _flush_on_exit():
+    try:
+        flush_focus_store(focus_store)
+    except Exception as e:
+        logger.error(f"Error flushing focus store on exit: {str(e)}")
@@ -0,0 +1,92 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import connection
+from .models import FocusSample
+
+logger = logging.getLogger(__name__)
+
+# Buffer settings, overridable through settings.FOCUS_SAMPLE_BUFFER
+DEFAULT_BATCH_SIZE = 500  # Flush once this many samples are waiting
+DEFAULT_FLUSH_INTERVAL_MS = 1000  # Or once the oldest sample waited this long
+
+
+class FocusSampleBuffer:
+    """Collect FocusSample rows in memory and write them with bulk_create"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._lock = threading.Lock()
+        self._samples = []
+        self._timer = None
+
+    def add(self, sample):
+        """Queue a sample, flushing when the batch is full"""
+        self.extend([sample])
+
+    def extend(self, samples):
+        """Queue several samples, flushing when the batch is full"""
+        batch = None
+        with self._lock:
+            self._samples.extend(samples)
+            if len(self._samples) >= self.batch_size:
+                batch = self._take()
+            elif self._samples and self._timer is None:
+                # The first queued sample starts the flush deadline
+                self._timer = threading.Timer(
+                    self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        """Write every queued sample now"""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def _take(self):
+        """Swap out the queued samples, caller must hold the lock"""
+        batch, self._samples = self._samples, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Timer threads are not reused, don't leak their connection
+            connection.close()
+
+    def _write(self, batch):
+        try:
+            FocusSample.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception as e:
+            # History is best effort, DataStream keeps the latest value
+            logger.error(f"Error writing {len(batch)} focus samples: {str(e)}")
+
+
+def _create_buffer():
+    config = getattr(settings, 'FOCUS_SAMPLE_BUFFER', {})
+    return FocusSampleBuffer(
+        batch_size=config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        flush_interval_ms=config.get(
+            'FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS),
+    )
+
+
+focus_sample_buffer = _create_buffer()
+
+# Don't lose the last partial batch on shutdown
+atexit.register(focus_sample_buffer.flush)
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import random
+import string
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# IPC layer settings
+DEFAULT_ADDRESS = ('127.0.0.1', 6390)
+DEFAULT_AUTHKEY = 'meeting-room'
+RECEIVE_TIMEOUT = 1  # Seconds a receive call waits in the broker before polling again
+RECEIVE_BATCH_SIZE = 100  # Messages handed to a process per receive call
+
+
+class ChannelBroker:
+    """Queues and groups shared by every process using an IPCChannelLayer
+
+    Messages for process-specific channels are queued under the process
+    part of the name, so each process drains all of its channels with one
+    call. Expiry times and capacities are sent by the layers.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._pending = {}
+        self._groups = {}
+
+    def _queue_name(self, channel):
+        return channel[:channel.find('!') + 1] if '!' in channel else channel
+
+    def _put(self, channel, message, expires, capacity):
+        if self._pending.get(channel, 0) >= capacity:
+            return False
+        self._queues.setdefault(self._queue_name(channel), deque()).append(
+            (expires, channel, message))
+        self._pending[channel] = self._pending.get(channel, 0) + 1
+        return True
+
+    def send(self, channel, message, expires, capacity):
+        """Queue a message, return False if the channel is full"""
+        with self._condition:
+            sent = self._put(channel, message, expires, capacity)
+            self._condition.notify_all()
+            return sent
+
+    def receive(self, names, timeout, limit=RECEIVE_BATCH_SIZE):
+        """Wait for messages on any of the queues, return up to limit (channel, message) pairs"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                messages = []
+                now = time.time()
+                for name in names:
+                    queue = self._queues.get(name)
+                    while queue and len(messages) < limit:
+                        expires, channel, message = queue.popleft()
+                        self._pending[channel] -= 1
+                        if not self._pending[channel]:
+                            del self._pending[channel]
+                        if expires > now:
+                            messages.append((channel, message))
+                    if queue is not None and not queue:
+                        del self._queues[name]
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0:
+                    return messages
+                self._condition.wait(remaining)
+
+    def group_add(self, group, channel, expires):
+        with self._condition:
+            self._groups.setdefault(group, {})[channel] = expires
+
+    def group_discard(self, group, channel):
+        with self._condition:
+            channels = self._groups.get(group)
+            if channels:
+                channels.pop(channel, None)
+                if not channels:
+                    del self._groups[group]
+
+    def group_send(self, group, message, expires, capacity):
+        """Queue a message for every member of a group, full channels miss it"""
+        with self._condition:
+            channels = self._groups.get(group, {})
+            now = time.time()
+            for channel, member_until in list(channels.items()):
+                if member_until < now:
+                    del channels[channel]
+                else:
+                    self._put(channel, message, expires, capacity)
+            self._condition.notify_all()
+
+    def flush(self):
+        with self._condition:
+            self._queues.clear()
+            self._pending.clear()
+            self._groups.clear()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Get the broker of this process, used by the server side of BrokerManager"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = ChannelBroker()
+        return _broker
+
+
+class BrokerManager(BaseManager):
+    pass
+
+
+BrokerManager.register('broker', callable=get_broker)
+
+
+def broker_address(address):
+    """Accept (host, port) pairs as well as the lists settings and JSON produce"""
+    if isinstance(address, str):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return tuple(address)
+
+
+def serve_broker(address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+    """Create the broker server, call serve_forever() on the result to run it"""
+    manager = BrokerManager(address=broker_address(address), authkey=authkey.encode())
+    return manager.get_server()
+
+
+class IPCChannelLayer(BaseChannelLayer):
+    """Channel layer backed by a broker process over a local socket
+
+    A dependency-free stand-in for RedisChannelLayer when several worker
+    processes on one machine share rooms, e.g. in tests and benchmarks.
+    Start the broker with `python manage.py run_channel_broker`.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        address=DEFAULT_ADDRESS,
+        authkey=DEFAULT_AUTHKEY,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        max_workers=8,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.address = broker_address(address)
+        self.authkey = authkey.encode()
+        self.group_expiry = group_expiry
+        self.client_prefix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ipc-layer')
+        self._broker = None
+        self._lock = threading.Lock()
+        # Specific channel -> (loop, queue) of the coroutine receiving it
+        self._buffers = {}
+        self._receiver = None
+
+    def _get_broker(self):
+        with self._lock:
+            if self._broker is None:
+                manager = BrokerManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._broker = manager.broker()
+            return self._broker
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: getattr(self._get_broker(), method)(*args))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        sent = await self._call(
+            'send', channel, message, time.time() + self.expiry, self.get_capacity(channel))
+        if not sent:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if '!' not in channel:
+            # Plain channels are polled, consumers only use specific ones
+            while True:
+                messages = await self._call('receive', [channel], RECEIVE_TIMEOUT, 1)
+                if messages:
+                    return messages[0][1]
+
+        with self._lock:
+            if channel not in self._buffers:
+                self._buffers[channel] = (asyncio.get_running_loop(), asyncio.Queue())
+            queue = self._buffers[channel][1]
+            self._start_receiver()
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # The consumer is gone, later messages for it are dropped
+            with self._lock:
+                self._buffers.pop(channel, None)
+            raise
+
+    async def new_channel(self, prefix='specific'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{prefix}.{self.client_prefix}!{suffix}"
+
+    def _start_receiver(self):
+        if self._receiver is None or not self._receiver.is_alive():
+            self._receiver = threading.Thread(
+                target=self._receive_loop, name='ipc-layer-receiver', daemon=True)
+            self._receiver.start()
+
+    def _receive_loop(self):
+        """Drain this process's queues in the broker into the local buffers"""
+        while True:
+            with self._lock:
+                names = list({self.non_local_name(channel) for channel in self._buffers})
+                if not names:
+                    self._receiver = None
+                    return
+            try:
+                messages = self._get_broker().receive(names, RECEIVE_TIMEOUT)
+            except Exception as e:
+                # Reconnect on the next round, e.g. after a broker restart
+                logger.error(f"Error receiving from channel broker: {str(e)}")
+                with self._lock:
+                    self._broker = None
+                time.sleep(RECEIVE_TIMEOUT)
+                continue
+            for channel, message in messages:
+                with self._lock:
+                    buffer = self._buffers.get(channel)
+                if buffer is not None:
+                    loop, queue = buffer
+                    loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._call('group_add', group, channel, time.time() + self.group_expiry)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._call('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        await self._call('group_send', group, message, time.time() + self.expiry, self.capacity)
+
+    # Flush extension
+
+    async def flush(self):
+        await self._call('flush')
+
+    async def close(self):
+        with self._lock:
+            self._buffers.clear()
@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import statistics
+import threading
+import time
+import uuid
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from meeting_room.layers import DEFAULT_ADDRESS, DEFAULT_AUTHKEY, serve_broker
+
+# Seconds a worker waits for the last message before reporting what it got
+RECEIVE_GRACE = 5
+
+
+def run_worker(alias, group, receivers, messages, ready, results):
+    """Join receivers channels to a group in a fresh process and time every delivery"""
+    import django
+
+    django.setup()
+    results.put(asyncio.run(_receive(alias, group, receivers, messages, ready)))
+
+
+async def _receive(alias, group, receivers, messages, ready):
+    layer = get_channel_layer(alias)
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+    ready.put(True)
+
+    latencies = []
+
+    async def consume(channel):
+        for _ in range(messages):
+            message = await layer.receive(channel)
+            latencies.append(time.time() - message['sent'])
+
+    tasks = [asyncio.create_task(consume(channel)) for channel in channels]
+    # Messages dropped by a full channel never arrive, stop waiting for them
+    _, pending = await asyncio.wait(tasks, timeout=messages * 0.1 + RECEIVE_GRACE)
+    for task in pending:
+        task.cancel()
+    for channel in channels:
+        await layer.group_discard(group, channel)
+    return latencies
+
+
+class Command(BaseCommand):
+    help = "Measure group_send latency of one room whose members are spread over N processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,2,4',
+            help="Comma separated worker process counts to measure (default: 1,2,4)")
+        parser.add_argument(
+            '--receivers', type=int, default=25,
+            help="Connections of the room held by each worker (default: 25)")
+        parser.add_argument(
+            '--messages', type=int, default=50,
+            help="Broadcasts sent to the room (default: 50)")
+        parser.add_argument(
+            '--interval', type=float, default=0.01,
+            help="Seconds between two broadcasts (default: 0.01)")
+        parser.add_argument(
+            '--layer', default='default',
+            help="CHANNEL_LAYERS alias to benchmark (default: default)")
+        parser.add_argument(
+            '--start-broker', action='store_true',
+            help="Run the broker of an IPCChannelLayer inside this command")
+
+    def handle(self, *args, **options):
+        config = getattr(settings, 'CHANNEL_LAYERS', {}).get(options['layer'])
+        if config is None:
+            raise CommandError(f"No channel layer named {options['layer']}")
+        if config['BACKEND'].endswith('InMemoryChannelLayer'):
+            raise CommandError("InMemoryChannelLayer does not cross processes, use a shared layer")
+
+        if options['start_broker']:
+            layer_config = config.get('CONFIG', {})
+            server = serve_broker(
+                layer_config.get('address', DEFAULT_ADDRESS),
+                layer_config.get('authkey', DEFAULT_AUTHKEY))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.stdout.write(
+            f"{'workers':>8} {'receivers':>10} {'delivered':>12} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for workers in [int(count) for count in options['workers'].split(',')]:
+            latencies, expected = self.run_room(workers, options)
+            self.write_row(workers, workers * options['receivers'], latencies, expected)
+
+    def run_room(self, workers, options):
+        """Broadcast to a room spread over workers processes, return (latencies, expected)"""
+        # Spawned workers start without this process's threads and event loops
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Queue(), context.Queue()
+        group = f"benchmark_{uuid.uuid4().hex[:8]}"
+        processes = [
+            context.Process(target=run_worker, args=(
+                options['layer'], group, options['receivers'], options['messages'], ready, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get()
+
+        asyncio.run(self.broadcast(group, options))
+
+        latencies = []
+        for _ in processes:
+            latencies.extend(results.get())
+        for process in processes:
+            process.join()
+        return latencies, workers * options['receivers'] * options['messages']
+
+    async def broadcast(self, group, options):
+        layer = get_channel_layer(options['layer'])
+        for _ in range(options['messages']):
+            await layer.group_send(group, {'type': 'benchmark.message', 'sent': time.time()})
+            await asyncio.sleep(options['interval'])
+
+    def write_row(self, workers, receivers, latencies, expected):
+        delivered = f"{len(latencies)}/{expected}"
+        if not latencies:
+            self.stdout.write(f"{workers:>8} {receivers:>10} {delivered:>12}")
+            return
+        latencies = sorted(latency * 1000 for latency in latencies)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f"{workers:>8} {receivers:>10} {delivered:>12} {percentiles[49]:>8.2f} "
+            f"{percentiles[94]:>8.2f} {percentiles[98]:>8.2f} {latencies[-1]:>8.2f}")
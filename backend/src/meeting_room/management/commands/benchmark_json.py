@@ -0,0 +1,70 @@
+import time
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+from meeting_room.codec import CODECS
+
+
+def focus_rows(students):
+    """Build the focus rows of a room as served to teacher dashboards"""
+    timestamp = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            'room': '0b7c1d4e-5f60-4a1b-9c2d-3e4f5a6b7c8d',
+            'room_name': 'Benchmark room',
+            'user': str(i),
+            'username': f'student{i}',
+            'focus_data': 50 + i % 50,
+            'status': 'online',
+            'timestamp': timestamp
+        }
+        for i in range(students)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare the JSON codecs and per-recipient against encode-once broadcasts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--students', type=int, default=100,
+            help="Students of the benchmark room (default: 100)")
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help="Iterations of each case (default: 200)")
+
+    def handle(self, *args, **options):
+        students, repeat = options['students'], options['repeat']
+        codecs = []
+        for name, codec_class in CODECS.items():
+            try:
+                codecs.append(codec_class())
+            except ImportError:
+                self.stdout.write(f"{name} is not installed, skipped")
+
+        rows = focus_rows(students)
+        frame = {'type': 'focus_update', 'focus_data': 87.5, 'status': 'online'}
+        default = JSONEncoder().default
+
+        self.stdout.write(f"{'case':<36} {'codec':>8} {'us/op':>10}")
+        for codec in codecs:
+            encoded_frame = codec.dumps(frame)
+            cases = {
+                'decode inbound frame': lambda: codec.loads(encoded_frame),
+                'encode focus rows': lambda: codec.dumps_bytes(rows, default),
+                # What consumers did before: every recipient encodes the event
+                f'broadcast to {students}, per recipient': lambda: [
+                    codec.dumps({'type': 'focus_update', 'data': rows}) for _ in range(students)],
+                f'broadcast to {students}, encode once': lambda: [
+                    codec.dumps({'type': 'focus_update', 'data': rows})] * students,
+            }
+            for case, run in cases.items():
+                self.stdout.write(f"{case:<36} {codec.name:>8} {self.time(run, repeat):>10.1f}")
+
+    def time(self, run, repeat):
+        """Return the mean microseconds of one run"""
+        run()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            run()
+        return (time.perf_counter() - start) / repeat * 1e6
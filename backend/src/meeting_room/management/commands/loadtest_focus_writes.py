@@ -0,0 +1,72 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from meeting_room.focus import save_focus_sample
+from meeting_room.focus_store import focus_store, flush_focus_store
+from meeting_room.ingest import focus_sample_buffer
+from meeting_room.membership import get_room_members
+from meeting_room.models import CustomUser, Room, RoomParticipant
+
+
+class Command(BaseCommand):
+    help = "Measure focus-data write throughput of one room for growing student counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--students', default='10,50,200',
+            help="Comma separated student counts to measure (default: 10,50,200)")
+        parser.add_argument(
+            '--samples', type=int, default=20,
+            help="Samples written by each student (default: 20)")
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help="Concurrent writer threads (default: 8)")
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['students'].split(',')]
+        prefix = f"loadtest_{uuid.uuid4().hex[:8]}"
+        teacher = CustomUser.objects.create(
+            username=f"{prefix}_teacher", role='teacher')
+
+        self.stdout.write(f"{'students':>10} {'writes':>10} {'seconds':>10} {'writes/s':>10}")
+        try:
+            for count in counts:
+                writes, elapsed = self.run_room(prefix, teacher, count, options)
+                self.stdout.write(
+                    f"{count:>10} {writes:>10} {elapsed:>10.2f} {writes / elapsed:>10.0f}")
+        finally:
+            # Write what is queued before its rows disappear with the room
+            flush_focus_store(focus_store)
+            focus_sample_buffer.flush()
+            Room.objects.filter(meeting_id__startswith=prefix).delete()
+            CustomUser.objects.filter(username__startswith=prefix).delete()
+
+    def run_room(self, prefix, teacher, count, options):
+        """Write samples for count students of a fresh room, return (writes, seconds)"""
+        meeting_id = f"{prefix}_{count}"
+        room = Room.objects.create(name=meeting_id, teacher=teacher, meeting_id=meeting_id)
+        students = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{meeting_id}_{i}", role='student')
+            for i in range(count)
+        ])
+        RoomParticipant.objects.bulk_create([
+            RoomParticipant(room=room, user=student) for student in students
+        ])
+
+        def write(student):
+            try:
+                for i in range(options['samples']):
+                    # Same checks as save_focus_data, minus HTTP and auth
+                    members = get_room_members(meeting_id)
+                    if student.id in members['participant_ids']:
+                        save_focus_sample(room.id, room.name, student, i % 100, 'online')
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            list(executor.map(write, students))
+        elapsed = time.perf_counter() - start
+        return count * options['samples'], elapsed
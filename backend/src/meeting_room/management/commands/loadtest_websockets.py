@@ -0,0 +1,213 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+from meeting_room.focus_store import focus_store, flush_focus_store
+from meeting_room.ingest import focus_sample_buffer
+from meeting_room.middleware import TokenAuthMiddlewareStack
+from meeting_room.models import CustomUser, Room, RoomParticipant
+from meeting_room.routing import websocket_urlpatterns
+from meeting_room.stats import process_stats
+
+CONNECT_TIMEOUT = 10  # Seconds a simulated client waits for its handshake
+DRAIN_TIME = 1  # Seconds to keep reading after the last frame was sent
+
+
+def percentile(values, percent):
+    """Get a percentile of a list of values, None when it is empty"""
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+class Command(BaseCommand):
+    help = "Measure how many room WebSocket connections one worker sustains"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--students', type=int, default=50,
+            help="Simulated student connections (default: 50)")
+        parser.add_argument(
+            '--teachers', type=int, default=1,
+            help="Simulated teacher dashboards, all of the room's teacher (default: 1)")
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help="Seconds students keep sending (default: 10)")
+        parser.add_argument(
+            '--focus-rate', type=float, default=1,
+            help="focus_update frames per second per student (default: 1)")
+        parser.add_argument(
+            '--chat-rate', type=float, default=0.1,
+            help="Chat messages per second per student (default: 0.1)")
+        parser.add_argument(
+            '--connect-concurrency', type=int, default=50,
+            help="Handshakes in flight at once (default: 50)")
+
+    def handle(self, *args, **options):
+        prefix = f"wsload_{uuid.uuid4().hex[:8]}"
+        teacher = CustomUser.objects.create(username=f"{prefix}_teacher", role='teacher')
+        room = Room.objects.create(name=prefix, teacher=teacher, meeting_id=prefix)
+        students = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}_{i}", role='student')
+            for i in range(options['students'])
+        ])
+        RoomParticipant.objects.bulk_create([
+            RoomParticipant(room=room, user=user) for user in [teacher] + students
+        ])
+        tokens = {
+            token.user_id: token.key
+            for token in Token.objects.bulk_create([
+                Token(key=Token.generate_key(), user=user) for user in [teacher] + students
+            ])
+        }
+
+        try:
+            clients = (
+                [('teacher', tokens[teacher.id])] * options['teachers']
+                + [('student', tokens[student.id]) for student in students]
+            )
+            results = asyncio.run(self.run_room(room.meeting_id, clients, options))
+            self.write_report(results)
+        finally:
+            # Write what is queued before its rows disappear with the room
+            flush_focus_store(focus_store)
+            focus_sample_buffer.flush()
+            room.delete()
+            CustomUser.objects.filter(username__startswith=prefix).delete()
+
+    async def run_room(self, meeting_id, clients, options):
+        """Connect every client, let students send for the duration, return the measurements"""
+        application = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        results = {
+            'connect': [],
+            'failed': 0,
+            'sent': {'focus_update': 0, 'chat_message': 0},
+            'latency': {'focus_update': [], 'chat_message': []},
+            'received': 0,
+        }
+        handshakes = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(role, token):
+            communicator = WebsocketCommunicator(application, f"/ws/room/{meeting_id}/?token={token}")
+            async with handshakes:
+                start = time.perf_counter()
+                try:
+                    connected, _ = await communicator.connect(timeout=CONNECT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    connected = False
+                if not connected:
+                    results['failed'] += 1
+                    return None
+                results['connect'].append(time.perf_counter() - start)
+            return role, communicator
+
+        connections = [
+            connection for connection in
+            await asyncio.gather(*(connect(role, token) for role, token in clients))
+            if connection
+        ]
+        readers = [
+            asyncio.create_task(self.read(communicator, results))
+            for _, communicator in connections
+        ]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self.send(communicator, results, options)
+            for role, communicator in connections if role == 'student'
+        ))
+        await asyncio.sleep(DRAIN_TIME)
+        results['elapsed'] = time.perf_counter() - start
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(
+            *(communicator.disconnect() for _, communicator in connections),
+            return_exceptions=True
+        )
+        return results
+
+    async def send(self, communicator, results, options):
+        """Send focus and chat frames of one student at the configured rates"""
+        deadline = time.monotonic() + options['duration']
+        rates = {'focus_update': options['focus_rate'], 'chat_message': options['chat_rate']}
+        # Spread the students' first frames over one interval
+        next_at = {
+            kind: time.monotonic() + random.random() / rate
+            for kind, rate in rates.items() if rate > 0
+        }
+        while next_at:
+            kind, at = min(next_at.items(), key=lambda item: item[1])
+            if at > deadline:
+                break
+            await asyncio.sleep(max(0, at - time.monotonic()))
+            if kind == 'focus_update':
+                frame = {'type': 'focus_update', 'focus_data': random.randint(0, 100), 'status': 'online'}
+            else:
+                frame = {'type': 'message', 'message': 'load test', 'timestamp': time.time()}
+            await communicator.send_to(text_data=json.dumps(frame))
+            results['sent'][kind] += 1
+            next_at[kind] = at + 1 / rates[kind]
+
+    async def read(self, communicator, results):
+        """Record the latency of every focus update and chat message a client gets"""
+        while True:
+            # Read the queue directly, receive_output() cancels the app on a timeout
+            message = await communicator.output_queue.get()
+            if message['type'] != 'websocket.send' or not message.get('text'):
+                continue
+            results['received'] += 1
+            frame = json.loads(message['text'])
+            now = time.time()
+            if frame['type'] == 'focus_update':
+                # Rows carry the time the server stored them, right after receiving the frame
+                results['latency']['focus_update'].extend(
+                    now - datetime.fromisoformat(row['timestamp']).timestamp()
+                    for row in frame['data']
+                )
+            elif frame['type'] == 'chat_message' and isinstance(frame.get('timestamp'), float):
+                results['latency']['chat_message'].append(now - frame['timestamp'])
+
+    def write_report(self, results):
+        connects = sorted(latency * 1000 for latency in results['connect'])
+        self.stdout.write(
+            f"connections: {len(connects)} open, {results['failed']} failed, "
+            f"connect p50 {percentile(connects, 50) or 0:.1f} ms, "
+            f"p99 {percentile(connects, 99) or 0:.1f} ms")
+
+        self.stdout.write(f"{'frames':<14} {'sent':>8} {'delivered':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for kind, latencies in results['latency'].items():
+            latencies = sorted(latency * 1000 for latency in latencies)
+            p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+            self.stdout.write(
+                f"{kind:<14} {results['sent'][kind]:>8} {len(latencies):>10} "
+                f"{p50 or 0:>8.1f} {p99 or 0:>8.1f}")
+
+        self.stdout.write(
+            f"received: {results['received']} frames, "
+            f"{results['received'] / results['elapsed']:.0f} messages/s")
+
+        # The consumers ran in this process, its queues saw the whole load
+        stats = process_stats()
+        executor = stats['db_executor']
+        self.stdout.write(
+            f"db executor: {executor['max_workers']} threads, {executor.get('submitted', 0)} calls, "
+            f"{executor.get('shed', 0)} connections shed, "
+            f"wait avg {executor['wait_average_ms']:.1f} ms, max {executor['wait_max_ms']:.1f} ms, "
+            f"{executor['queued']} still queued")
+        coalescer = stats['data_coalescer']
+        self.stdout.write(
+            f"data batches: {coalescer.get('received', 0)} frames received, "
+            f"{coalescer.get('sent', 0)} sent in {coalescer.get('batches', 0)} batches, "
+            f"{coalescer.get('rate_limited', 0)} rate limited, {coalescer.get('dropped', 0)} dropped, "
+            f"{coalescer.get('send_errors', 0)} send errors")
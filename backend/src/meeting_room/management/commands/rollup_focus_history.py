@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from meeting_room.rollup import rollup_focus_history
+
+
+class Command(BaseCommand):
+    help = "Compact old focus samples into 1-minute and 1-hour buckets and drop expired buckets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--raw-retention', type=int,
+            help="Seconds raw samples are kept, overrides FOCUS_ROLLUP['RAW_RETENTION']")
+        parser.add_argument(
+            '--minute-retention', type=int,
+            help="Seconds 1-minute buckets are kept, overrides FOCUS_ROLLUP['MINUTE_RETENTION']")
+
+    def handle(self, *args, **options):
+        result = rollup_focus_history(
+            raw_retention=options['raw_retention'],
+            minute_retention=options['minute_retention']
+        )
+        self.stdout.write(
+            f"Compacted {result['samples']} samples into {result['buckets']} buckets, "
+            f"deleted {result['expired']} expired minute buckets")
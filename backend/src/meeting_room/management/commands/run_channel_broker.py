@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from meeting_room.layers import DEFAULT_ADDRESS, DEFAULT_AUTHKEY, broker_address, serve_broker
+
+
+class Command(BaseCommand):
+    help = "Run the broker shared by the worker processes of an IPCChannelLayer"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layer', default='default',
+            help="CHANNEL_LAYERS alias to read address and authkey from (default: default)")
+        parser.add_argument(
+            '--address',
+            help="host:port to listen on, overrides the layer's address")
+
+    def handle(self, *args, **options):
+        config = getattr(settings, 'CHANNEL_LAYERS', {}).get(options['layer'], {}).get('CONFIG', {})
+        address = broker_address(options['address'] or config.get('address', DEFAULT_ADDRESS))
+        server = serve_broker(address, config.get('authkey', DEFAULT_AUTHKEY))
+        self.stdout.write(f"Channel broker listening on {address[0]}:{address[1]}")
+        server.serve_forever()
@@ -0,0 +1,69 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from .caching import bump_room_generation
+from .focus import room_group_name
+from .models import Room, RoomParticipant
+
+logger = logging.getLogger(__name__)
+
+# Cache settings
+MEMBERSHIP_CACHE_TIMEOUT = 300  # Cache for 5 minutes, membership signals invalidate it
+
+
+def get_cache_key(meeting_id):
+    """Generate cache key for the members of a room"""
+    return f"room_members_{meeting_id}"
+
+
+def get_room_members(meeting_id):
+    """Get the identity, state and participant ids of a room, None if it does not exist
+
+    The returned dict holds room_id, name, teacher_id, teacher_username,
+    is_active and participant_ids, and must not be modified.
+    """
+    cache_key = get_cache_key(meeting_id)
+    members = cache.get(cache_key)
+    if members is None:
+        room = Room.objects.filter(meeting_id=meeting_id).values(
+            'id', 'name', 'teacher_id', 'teacher__username', 'is_active').first()
+        if room is None:
+            return None
+
+        members = {
+            'room_id': room['id'],
+            'name': room['name'],
+            'teacher_id': room['teacher_id'],
+            'teacher_username': room['teacher__username'],
+            'is_active': room['is_active'],
+            'participant_ids': frozenset(
+                RoomParticipant.objects.filter(
+                    room_id=room['id']).values_list('user_id', flat=True)
+            ),
+        }
+        cache.set(cache_key, members, MEMBERSHIP_CACHE_TIMEOUT)
+    return members
+
+
+def invalidate_room_members(meeting_id, room_id):
+    """Drop the cached members of a room after a join, leave, kick or deactivation"""
+    cache.delete(get_cache_key(meeting_id))
+    # Cached participant lists are keyed on this generation
+    bump_room_generation(room_id, 'participants')
+    broadcast_membership_change(meeting_id)
+
+
+def broadcast_membership_change(meeting_id):
+    """Tell the open connections of a room to reload the identity they resolved at connect"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    try:
+        async_to_sync(channel_layer.group_send)(
+            room_group_name(meeting_id),
+            {'type': 'membership_changed'}
+        )
+    except Exception as e:
+        logger.error(f"Error broadcasting membership change: {str(e)}")
@@ -1,15 +1,11 @@
 from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
-from rest_framework.authtoken.models import Token
 from urllib.parse import parse_qs
+from .authentication import get_cached_user, get_user_for_token
+from .executor import database_sync_to_async, db_executor
 
 @database_sync_to_async
 def get_user_from_token(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
-        return None
+    return get_user_for_token(token_key)
 
 class TokenAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
@@ -18,7 +14,14 @@ class TokenAuthMiddleware(BaseMiddleware):
         token_key = params.get('token', [None])[0]
         
         if token_key:
-            scope['user'] = await get_user_from_token(token_key)
+            # A hit in the in-process token cache skips the thread pool hop
+            scope['user'] = get_cached_user(token_key)
+            if scope['user'] is None:
+                # Don't queue behind a backed up pool, the consumer refuses the connection
+                if db_executor.should_shed():
+                    scope['load_shed'] = True
+                else:
+                    scope['user'] = await get_user_from_token(token_key)
         else:
             scope['user'] = None
             
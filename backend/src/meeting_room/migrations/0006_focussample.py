@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meeting_room', '0005_remove_datastream_data_datastream_focus_data_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FocusSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.DateTimeField()),
+                ('score', models.FloatField()),
+                ('status', models.CharField(choices=[('online', 'Online'), ('offline', 'Offline')], max_length=20)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='focus_samples', to='meeting_room.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='focus_samples', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'ts'], name='meeting_roo_room_id_c43e00_idx'), models.Index(fields=['room', 'user', 'ts'], name='meeting_roo_room_id_e7000e_idx')],
+            },
+        ),
+    ]
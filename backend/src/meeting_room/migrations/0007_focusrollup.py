@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meeting_room', '0006_focussample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FocusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, '1 minute'), (3600, '1 hour')])),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('mean', models.FloatField()),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='focus_rollups', to='meeting_room.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='focus_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'resolution', 'bucket'], name='meeting_roo_room_id_575802_idx')],
+                'unique_together': {('room', 'user', 'resolution', 'bucket')},
+            },
+        ),
+    ]
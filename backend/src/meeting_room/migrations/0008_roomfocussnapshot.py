@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meeting_room', '0007_focusrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomFocusSnapshot',
+            fields=[
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='focus_snapshot', serialize=False, to='meeting_room.room')),
+                ('user_ids', models.BinaryField()),
+                ('scores', models.BinaryField()),
+                ('statuses', models.BinaryField()),
+                ('timestamps', models.BinaryField()),
+                ('usernames', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
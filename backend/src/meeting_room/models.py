@@ -41,12 +41,15 @@ class RoomParticipant(models.Model):
         return f"{self.user.username} in {self.room.name}"
 
 
+FOCUS_STATUSES = [('online', 'Online'), ('offline', 'Offline')]
+
+
 class DataStream(models.Model):
     """Model to store focus data for analysis"""
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='data_streams')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='focus_data')
     focus_data = models.FloatField()  # Store focus percentage
-    status = models.CharField(max_length=20, choices=[('online', 'Online'), ('offline', 'Offline')])
+    status = models.CharField(max_length=20, choices=FOCUS_STATUSES)
     timestamp = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -58,3 +61,64 @@ class DataStream(models.Model):
 
     def __str__(self):
         return f"Focus data from {self.user.username} at {self.timestamp}"
+
+
+class FocusSample(models.Model):
+    """Append-only history of every focus sample sent by a student"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='focus_samples')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='focus_samples')
+    ts = models.DateTimeField()
+    score = models.FloatField()  # Focus percentage at ts
+    status = models.CharField(max_length=20, choices=FOCUS_STATUSES)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'ts']),
+            models.Index(fields=['room', 'user', 'ts']),
+        ]
+
+    def __str__(self):
+        return f"Focus sample from {self.user.username} at {self.ts}"
+
+
+ROLLUP_RESOLUTIONS = [(60, '1 minute'), (3600, '1 hour')]
+
+
+class FocusRollup(models.Model):
+    """Online focus samples of a student compacted into one time bucket"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='focus_rollups')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='focus_rollups')
+    resolution = models.PositiveIntegerField(choices=ROLLUP_RESOLUTIONS)  # Bucket length in seconds
+    bucket = models.DateTimeField()  # Start of the bucket
+    count = models.PositiveIntegerField()
+    min = models.FloatField()
+    max = models.FloatField()
+    mean = models.FloatField()
+
+    class Meta:
+        unique_together = ('room', 'user', 'resolution', 'bucket')
+        indexes = [
+            models.Index(fields=['room', 'resolution', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"Focus of {self.user.username} from {self.bucket} over {self.resolution}s"
+
+
+class RoomFocusSnapshot(models.Model):
+    """Latest focus of every student of a room packed into one row, read by primary key
+
+    Arrays are little-endian and share one order: user ids as int64, scores
+    and POSIX timestamps as float64, statuses as one byte each.
+    """
+    room = models.OneToOneField(
+        Room, on_delete=models.CASCADE, primary_key=True, related_name='focus_snapshot')
+    user_ids = models.BinaryField()
+    scores = models.BinaryField()
+    statuses = models.BinaryField()
+    timestamps = models.BinaryField()
+    usernames = models.TextField()  # One per line, usernames can't contain newlines
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Focus snapshot of {self.room_id}"
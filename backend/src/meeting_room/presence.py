@@ -0,0 +1,203 @@
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .codec import dumps_bytes, loads
+
+# Presence settings, overridable through settings.PRESENCE
+DEFAULT_BACKEND = 'meeting_room.presence.LocalPresenceStore'
+DEFAULT_TTL = 30  # Seconds a connection stays present without a heartbeat
+DEFAULT_HEARTBEAT_INTERVAL = 10  # Seconds between two heartbeats of a connection
+
+
+def presence_user(user):
+    """Build the presence record of a user, as sent to clients"""
+    return {'user_id': user.id, 'username': user.username, 'role': user.role}
+
+
+def _unique_users(users):
+    """Keep one record per user, a user may be connected from several tabs"""
+    return list({user['user_id']: user for user in users}.values())
+
+
+class LocalPresenceStore:
+    """In-process registry of the connections of each room, for tests and single workers
+
+    Rooms are keyed by meeting id. Each connection is identified by its
+    channel name and expires ttl seconds after its last heartbeat.
+    """
+
+    def __init__(self, TTL=DEFAULT_TTL, **options):
+        self.ttl = TTL
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+    def _live(self, room, now):
+        return [user for expires, user in room.values() if expires > now]
+
+    def join(self, meeting_id, channel_name, user):
+        """Register a connection, return True if it is the user's first one"""
+        now = time.time()
+        with self._lock:
+            room = self._rooms.setdefault(meeting_id, {})
+            present = any(u['user_id'] == user['user_id'] for u in self._live(room, now))
+            room[channel_name] = (now + self.ttl, user)
+            return not present
+
+    def touch(self, meeting_id, channel_name):
+        """Extend a connection's lifetime, return False if it already expired"""
+        now = time.time()
+        with self._lock:
+            room = self._rooms.get(meeting_id, {})
+            entry = room.get(channel_name)
+            if entry is None or entry[0] <= now:
+                return False
+            room[channel_name] = (now + self.ttl, entry[1])
+            return True
+
+    def leave(self, meeting_id, channel_name):
+        """Drop a connection, return its user if no other connection of theirs is left"""
+        with self._lock:
+            room = self._rooms.get(meeting_id, {})
+            entry = room.pop(channel_name, None)
+            if not room:
+                self._rooms.pop(meeting_id, None)
+            if entry is None:
+                return None
+            user = entry[1]
+            if any(u['user_id'] == user['user_id'] for u in self._live(room, time.time())):
+                return None
+            return user
+
+    def prune(self, meeting_id):
+        """Drop expired connections, return the users that are no longer present"""
+        now = time.time()
+        with self._lock:
+            room = self._rooms.get(meeting_id, {})
+            expired = [channel for channel, (expires, _) in room.items() if expires <= now]
+            users = [room.pop(channel)[1] for channel in expired]
+            present = {u['user_id'] for u in self._live(room, now)}
+            return _unique_users(u for u in users if u['user_id'] not in present)
+
+    def snapshot(self, meeting_id):
+        """Get the users with at least one live connection to a room"""
+        with self._lock:
+            return _unique_users(self._live(self._rooms.get(meeting_id, {}), time.time()))
+
+
+class RedisPresenceStore:
+    """Redis registry of the connections of each room, shared by every worker
+
+    A hash maps channel names to users and a sorted set holds their
+    expiry, so connections of a crashed worker expire on their own.
+    """
+
+    def __init__(self, LOCATION='redis://127.0.0.1:6379', TTL=DEFAULT_TTL, **options):
+        import redis
+
+        self.ttl = TTL
+        self._redis = redis.Redis.from_url(LOCATION)
+
+    def channels_key(self, meeting_id):
+        return f"presence:channels:{meeting_id}"
+
+    def expiry_key(self, meeting_id):
+        return f"presence:expiry:{meeting_id}"
+
+    def _live(self, meeting_id, now):
+        pipe = self._redis.pipeline()
+        pipe.hgetall(self.channels_key(meeting_id))
+        pipe.zrangebyscore(self.expiry_key(meeting_id), f"({now}", '+inf')
+        channels, live = pipe.execute()
+        return [loads(channels[channel]) for channel in live if channel in channels]
+
+    def _refresh(self, pipe, meeting_id):
+        # Rooms whose connections all vanished disappear after twice the ttl,
+        # leaving a prune the time to report their expired connections
+        pipe.expire(self.channels_key(meeting_id), self.ttl * 2)
+        pipe.expire(self.expiry_key(meeting_id), self.ttl * 2)
+
+    def join(self, meeting_id, channel_name, user):
+        """Register a connection, return True if it is the user's first one"""
+        now = time.time()
+        present = any(u['user_id'] == user['user_id'] for u in self._live(meeting_id, now))
+        pipe = self._redis.pipeline()
+        pipe.hset(self.channels_key(meeting_id), channel_name, dumps_bytes(user))
+        pipe.zadd(self.expiry_key(meeting_id), {channel_name: now + self.ttl})
+        self._refresh(pipe, meeting_id)
+        pipe.execute()
+        return not present
+
+    def touch(self, meeting_id, channel_name):
+        """Extend a connection's lifetime, return False if it already expired"""
+        now = time.time()
+        expiry_key = self.expiry_key(meeting_id)
+        expires = self._redis.zscore(expiry_key, channel_name)
+        if expires is None or expires <= now:
+            return False
+        pipe = self._redis.pipeline()
+        pipe.zadd(expiry_key, {channel_name: now + self.ttl}, xx=True)
+        self._refresh(pipe, meeting_id)
+        pipe.execute()
+        return True
+
+    def leave(self, meeting_id, channel_name):
+        """Drop a connection, return its user if no other connection of theirs is left"""
+        channels_key = self.channels_key(meeting_id)
+        pipe = self._redis.pipeline()
+        pipe.hget(channels_key, channel_name)
+        pipe.zrem(self.expiry_key(meeting_id), channel_name)
+        pipe.hdel(channels_key, channel_name)
+        user, removed, _ = pipe.execute()
+        # A prune of another worker already reported this connection
+        if user is None or not removed:
+            return None
+        user = loads(user)
+        if any(u['user_id'] == user['user_id'] for u in self._live(meeting_id, time.time())):
+            return None
+        return user
+
+    def prune(self, meeting_id):
+        """Drop expired connections, return the users that are no longer present"""
+        now = time.time()
+        channels_key = self.channels_key(meeting_id)
+        expiry_key = self.expiry_key(meeting_id)
+        expired = self._redis.zrangebyscore(expiry_key, '-inf', now)
+        if not expired:
+            return []
+
+        pipe = self._redis.pipeline()
+        for channel in expired:
+            pipe.zrem(expiry_key, channel)
+        removed = pipe.execute()
+        # ZREM is atomic, only the worker that removed a connection reports it
+        expired = [channel for channel, count in zip(expired, removed) if count]
+        if not expired:
+            return []
+
+        pipe = self._redis.pipeline()
+        pipe.hmget(channels_key, expired)
+        pipe.hdel(channels_key, *expired)
+        users, _ = pipe.execute()
+        present = {u['user_id'] for u in self._live(meeting_id, now)}
+        return _unique_users(
+            user for user in (loads(u) for u in users if u is not None)
+            if user['user_id'] not in present
+        )
+
+    def snapshot(self, meeting_id):
+        """Get the users with at least one live connection to a room"""
+        return _unique_users(self._live(meeting_id, time.time()))
+
+
+def _create_store():
+    config = getattr(settings, 'PRESENCE', {})
+    options = {key: value for key, value in config.items()
+               if key not in ('BACKEND', 'HEARTBEAT_INTERVAL')}
+    return import_string(config.get('BACKEND', DEFAULT_BACKEND))(**options)
+
+
+presence_store = _create_store()
+
+HEARTBEAT_INTERVAL = getattr(settings, 'PRESENCE', {}).get(
+    'HEARTBEAT_INTERVAL', DEFAULT_HEARTBEAT_INTERVAL)
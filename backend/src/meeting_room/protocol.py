@@ -0,0 +1,87 @@
+import struct
+from datetime import datetime, timezone
+from .models import FOCUS_STATUSES
+from .serializers import FocusBatchSerializer
+
+# WebSocket subprotocol of compact binary focus frames, all fields big-endian
+BINARY_SUBPROTOCOL = 'focus.bin.v1'
+
+# Client -> server: one sample, stored with the server's time
+FRAME_SAMPLE = 0x01
+# Client -> server: timestamped samples, offsets in ms from the base time
+FRAME_SAMPLE_BATCH = 0x02
+# Server -> teacher: latest samples of several students
+FRAME_FOCUS_UPDATE = 0x03
+
+SAMPLE = struct.Struct('!BBB')  # kind, score, status
+BATCH_HEADER = struct.Struct('!BdH')  # kind, base time in POSIX seconds, count
+BATCH_SAMPLE = struct.Struct('!IBB')  # offset ms, score, status
+UPDATE_ROW = struct.Struct('!IIBB')  # user id, offset ms, score, status
+MAX_OFFSET = 2 ** 32 - 1  # About 49 days, older rows are sent at this offset
+
+STATUS_CODES = {status: code for code, (status, _) in enumerate(FOCUS_STATUSES)}
+STATUSES = [status for status, _ in FOCUS_STATUSES]
+
+
+def _status(code):
+    if code >= len(STATUSES):
+        raise ValueError(f"Unknown status code {code}")
+    return STATUSES[code]
+
+
+def status_code(status):
+    """Code of a stored status, rows saved before statuses were validated count as offline"""
+    return STATUS_CODES.get(status, STATUS_CODES['offline'])
+
+
+def _score(focus_data):
+    """Clamp a focus score to the uint8 of the wire format"""
+    return max(0, min(255, round(focus_data)))
+
+
+def decode_frame(data):
+    """Decode a client frame into (kind, samples), raising ValueError when malformed
+
+    Samples have the focus_data, status and, for batches, timestamp keys of
+    FocusSampleInputSerializer. Batches come back ordered by timestamp.
+    """
+    if not data:
+        raise ValueError("Empty frame")
+    kind = data[0]
+    try:
+        if kind == FRAME_SAMPLE:
+            _, score, status = SAMPLE.unpack(data)
+            return kind, [{'focus_data': float(score), 'status': _status(status)}]
+
+        if kind == FRAME_SAMPLE_BATCH:
+            _, base, count = BATCH_HEADER.unpack_from(data)
+            if not 0 < count <= FocusBatchSerializer.MAX_SAMPLES:
+                raise ValueError(f"A batch holds 1 to {FocusBatchSerializer.MAX_SAMPLES} samples")
+            if len(data) != BATCH_HEADER.size + count * BATCH_SAMPLE.size:
+                raise ValueError("Batch length does not match its count")
+            samples = [
+                {
+                    'focus_data': float(score),
+                    'status': _status(status),
+                    'timestamp': datetime.fromtimestamp(base + offset / 1000, tz=timezone.utc)
+                }
+                for offset, score, status in BATCH_SAMPLE.iter_unpack(data[BATCH_HEADER.size:])
+            ]
+            return kind, sorted(samples, key=lambda sample: sample['timestamp'])
+    except (struct.error, OverflowError, OSError) as e:
+        raise ValueError(str(e))
+    raise ValueError(f"Unknown frame kind {kind}")
+
+
+def encode_focus_rows(rows):
+    """Encode focus rows, as served to dashboards, into one FRAME_FOCUS_UPDATE frame"""
+    entries = [
+        (int(row['user']), datetime.fromisoformat(row['timestamp']).timestamp(),
+         _score(row['focus_data']), status_code(row['status']))
+        for row in rows
+    ]
+    base = min((timestamp for _, timestamp, _, _ in entries), default=0)
+    return BATCH_HEADER.pack(FRAME_FOCUS_UPDATE, base, len(entries)) + b''.join(
+        UPDATE_ROW.pack(user_id, min(round((timestamp - base) * 1000), MAX_OFFSET), score, status)
+        for user_id, timestamp, score, status in entries
+    )
@@ -0,0 +1,14 @@
+from rest_framework.renderers import JSONRenderer
+from .codec import dumps_bytes
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding through the configured codec"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output is only asked for by humans, keep DRF's formatting
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps_bytes(data, default=self.encoder_class().default)
@@ -0,0 +1,204 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import FocusRollup, FocusSample
+
+logger = logging.getLogger(__name__)
+
+# Rollup settings, overridable through settings.FOCUS_ROLLUP
+DEFAULT_RAW_RETENTION = 60 * 60 * 24  # Seconds raw samples are kept, covers the longest analytics window
+DEFAULT_MINUTE_RETENTION = 60 * 60 * 24 * 7  # Seconds 1-minute buckets are kept, 1-hour ones are kept for good
+DEFAULT_INTERVAL = 60 * 10  # Seconds between two rollups of the periodic task, None disables it
+MAX_HISTORY_POINTS = 1440  # Buckets a range query may return, a day of minutes
+
+MINUTE, HOUR = 60, 3600
+RESOLUTIONS = [MINUTE, HOUR]  # Finest first
+TRUNC_KINDS = {MINUTE: 'minute', HOUR: 'hour'}
+ROLLUP_LOCK_KEY = 'focus_rollup_lock'
+
+
+def _config():
+    return getattr(settings, 'FOCUS_ROLLUP', {})
+
+
+def merge_bucket(bucket, other):
+    """Combine the count, min, max and mean of two buckets of the same time"""
+    count = bucket['count'] + other['count']
+    return {
+        'count': count,
+        'min': min(bucket['min'], other['min']),
+        'max': max(bucket['max'], other['max']),
+        'mean': (bucket['mean'] * bucket['count'] + other['mean'] * other['count']) / count,
+    }
+
+
+def bucket_samples(samples, resolution):
+    """Group online samples into (room, user, bucket) rows of the resolution in the database"""
+    return samples.filter(status='online').annotate(
+        bucket=Trunc('ts', TRUNC_KINDS[resolution], tzinfo=dt_timezone.utc)
+    ).values('room_id', 'user_id', 'bucket').annotate(
+        count=Count('id'), min=Min('score'), max=Max('score'), mean=Avg('score')
+    ).order_by()
+
+
+def _store_buckets(room_id, resolution, rows):
+    """Upsert bucket rows, merging them into buckets earlier runs already wrote"""
+    buckets = {(row['user_id'], row['bucket']): row for row in rows}
+    if not buckets:
+        return 0
+    # Late samples, e.g. batches with old client timestamps, land in existing buckets
+    existing = FocusRollup.objects.filter(
+        room_id=room_id, resolution=resolution,
+        bucket__in={bucket for _, bucket in buckets}
+    ).values('user_id', 'bucket', 'count', 'min', 'max', 'mean')
+    for row in existing:
+        key = (row['user_id'], row['bucket'])
+        if key in buckets:
+            buckets[key] = dict(buckets[key], **merge_bucket(buckets[key], row))
+
+    FocusRollup.objects.bulk_create(
+        [
+            FocusRollup(
+                room_id=room_id, user_id=user_id, resolution=resolution, bucket=bucket,
+                count=row['count'], min=row['min'], max=row['max'], mean=row['mean']
+            )
+            for (user_id, bucket), row in buckets.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['room', 'user', 'resolution', 'bucket'],
+        update_fields=['count', 'min', 'max', 'mean']
+    )
+    return len(buckets)
+
+
+def rollup_focus_history(now=None, raw_retention=None, minute_retention=None):
+    """Compact raw samples older than raw_retention into buckets and drop expired minute buckets
+
+    Every compacted sample goes into both its minute and its hour bucket,
+    then the raw rows are deleted, one room per transaction. Returns the
+    number of samples compacted, buckets written and minute buckets deleted.
+    """
+    config = _config()
+    now = now or timezone.now()
+    if raw_retention is None:
+        raw_retention = config.get('RAW_RETENTION', DEFAULT_RAW_RETENTION)
+    if minute_retention is None:
+        minute_retention = config.get('MINUTE_RETENTION', DEFAULT_MINUTE_RETENTION)
+
+    result = {'samples': 0, 'buckets': 0, 'expired': 0}
+    expired = FocusSample.objects.filter(ts__lt=now - timedelta(seconds=raw_retention))
+    # Compact up to the last row seen, rows written meanwhile wait for the next run
+    last_id = expired.aggregate(last_id=Max('id'))['last_id']
+    if last_id is not None:
+        expired = expired.filter(id__lte=last_id)
+        room_ids = expired.values_list('room_id', flat=True).distinct().order_by()
+        for room_id in list(room_ids):
+            samples = expired.filter(room_id=room_id)
+            with transaction.atomic():
+                for resolution in RESOLUTIONS:
+                    result['buckets'] += _store_buckets(
+                        room_id, resolution, bucket_samples(samples, resolution))
+                result['samples'] += samples.delete()[0]
+
+    result['expired'] = FocusRollup.objects.filter(
+        resolution=MINUTE, bucket__lt=now - timedelta(seconds=minute_retention)
+    ).delete()[0]
+    return result
+
+
+def pick_resolution(start, end, now=None):
+    """Pick the finest retained resolution that covers start to end in MAX_HISTORY_POINTS buckets"""
+    now = now or timezone.now()
+    minute_retention = _config().get('MINUTE_RETENTION', DEFAULT_MINUTE_RETENTION)
+    span = (end - start).total_seconds()
+    for resolution in RESOLUTIONS:
+        if span / resolution > MAX_HISTORY_POINTS:
+            continue
+        if resolution == MINUTE and start < now - timedelta(seconds=minute_retention):
+            continue
+        return resolution
+    return RESOLUTIONS[-1]
+
+
+def _truncate(moment, resolution):
+    timestamp = moment.timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % resolution, tz=dt_timezone.utc)
+
+
+def get_focus_history(room_id, start, end, user_id=None):
+    """Get the focus of a room, or one student, from start to end as (resolution, buckets)
+
+    Buckets come from the rollups and from raw samples not compacted yet,
+    merged per bucket start, so they don't depend on when the last rollup ran.
+    """
+    resolution = pick_resolution(start, end)
+    first = _truncate(start, resolution)
+    rollups = FocusRollup.objects.filter(
+        room_id=room_id, resolution=resolution, bucket__gte=first, bucket__lt=end)
+    samples = FocusSample.objects.filter(room_id=room_id, ts__gte=first, ts__lt=end)
+    if user_id is not None:
+        rollups = rollups.filter(user_id=user_id)
+        samples = samples.filter(user_id=user_id)
+
+    buckets = {}
+    rows = list(rollups.values('bucket', 'count', 'min', 'max', 'mean'))
+    rows += bucket_samples(samples, resolution)
+    for row in rows:
+        bucket = buckets.get(row['bucket'])
+        buckets[row['bucket']] = merge_bucket(bucket, row) if bucket else {
+            key: row[key] for key in ('count', 'min', 'max', 'mean')}
+    return resolution, [
+        dict(bucket, bucket=moment.isoformat(), mean=round(bucket['mean'], 2))
+        for moment, bucket in sorted(buckets.items())
+    ]
+
+
+class RollupScheduler(threading.Thread):
+    """Background thread running rollup_focus_history on an interval
+
+    Every worker runs one, a shared cache lock lets only one of them roll
+    up per interval.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='focus-rollup', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            if not cache.add(ROLLUP_LOCK_KEY, 1, self.interval):
+                continue
+            close_old_connections()
+            try:
+                rollup_focus_history()
+            except Exception as e:
+                logger.error(f"Error rolling up focus history: {str(e)}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_rollup_scheduler():
+    """Start the periodic rollup of this process once, unless INTERVAL is None"""
+    global _scheduler
+    if _scheduler is not None:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            interval = _config().get('INTERVAL', DEFAULT_INTERVAL)
+            if interval is None:
+                _scheduler = False
+                return
+            _scheduler = RollupScheduler(interval)
+            _scheduler.start()
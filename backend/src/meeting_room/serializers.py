@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Room, RoomParticipant, CustomUser, DataStream
+from .models import Room, RoomParticipant, CustomUser, DataStream, FOCUS_STATUSES
 from django.contrib.auth.hashers import make_password
 
 
@@ -58,4 +58,22 @@ class DataStreamSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataStream
         fields = ['room', 'room_name', 'user', 'username', 'focus_data', 'status', 'timestamp']
-        read_only_fields = ['timestamp']
\ No newline at end of file
+        read_only_fields = ['timestamp']
+
+class FocusSampleInputSerializer(serializers.Serializer):
+    focus_data = serializers.FloatField()
+    status = serializers.ChoiceField(choices=FOCUS_STATUSES)
+    timestamp = serializers.DateTimeField()
+
+
+class FocusBatchSerializer(serializers.Serializer):
+    MAX_SAMPLES = 1000
+
+    samples = FocusSampleInputSerializer(many=True, allow_empty=False)
+
+    def validate_samples(self, value):
+        """Bound the batch size and order the samples by timestamp."""
+        if len(value) > self.MAX_SAMPLES:
+            raise serializers.ValidationError(
+                f"A batch can hold at most {self.MAX_SAMPLES} samples.")
+        return sorted(value, key=lambda sample: sample['timestamp'])
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token
+from .membership import invalidate_room_members
+from .models import CustomUser, Room, RoomParticipant
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Stop accepting a deleted token"""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, **kwargs):
+    """Drop cached records of a user whose role or status may have changed"""
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    for token_key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(token_key)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    """Refresh the membership cache after a room is created, deactivated or deleted"""
+    # After commit, so nobody caches the membership of an uncommitted change
+    transaction.on_commit(
+        lambda: invalidate_room_members(instance.meeting_id, instance.id))
+
+
+@receiver(post_save, sender=RoomParticipant)
+@receiver(post_delete, sender=RoomParticipant)
+def participant_changed(sender, instance, **kwargs):
+    """Refresh the membership cache after a join, leave or kick"""
+    if RoomParticipant.room.is_cached(instance):
+        meeting_id = instance.room.meeting_id
+    else:
+        meeting_id = Room.objects.filter(
+            id=instance.room_id).values_list('meeting_id', flat=True).first()
+    if meeting_id is not None:
+        transaction.on_commit(
+            lambda: invalidate_room_members(meeting_id, instance.room_id))
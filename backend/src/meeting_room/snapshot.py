@@ -0,0 +1,107 @@
+import struct
+from datetime import datetime, timezone
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from .models import DataStream, RoomFocusSnapshot
+from .protocol import STATUSES, status_code
+
+_timestamp_field = serializers.DateTimeField()
+
+
+def pack_snapshot(values):
+    """Pack {user_id: (timestamp, score, status, username)} into RoomFocusSnapshot fields"""
+    user_ids = list(values)
+    count = len(user_ids)
+    return {
+        'user_ids': struct.pack(f'<{count}q', *user_ids),
+        'scores': struct.pack(f'<{count}d', *(values[user_id][1] for user_id in user_ids)),
+        'statuses': bytes(status_code(values[user_id][2]) for user_id in user_ids),
+        'timestamps': struct.pack(f'<{count}d', *(values[user_id][0] for user_id in user_ids)),
+        'usernames': '\n'.join(values[user_id][3] for user_id in user_ids),
+    }
+
+
+def unpack_snapshot(snapshot):
+    """Unpack a RoomFocusSnapshot into {user_id: (timestamp, score, status, username)}"""
+    # Databases may hand binary fields back as memoryview
+    user_ids = bytes(snapshot.user_ids)
+    count = len(user_ids) // 8
+    if not count:
+        return {}
+    return {
+        user_id: (timestamp, score, STATUSES[status], username)
+        for user_id, timestamp, score, status, username in zip(
+            struct.unpack(f'<{count}q', user_ids),
+            struct.unpack(f'<{count}d', bytes(snapshot.timestamps)),
+            struct.unpack(f'<{count}d', bytes(snapshot.scores)),
+            bytes(snapshot.statuses),
+            snapshot.usernames.split('\n'),
+        )
+    }
+
+
+def load_room_snapshot(room_id):
+    """Get the [timestamp, row] of every student from the room's snapshot, in one query
+
+    Returns None when the room has no snapshot yet.
+    """
+    snapshot = RoomFocusSnapshot.objects.select_related('room').only(
+        'user_ids', 'scores', 'statuses', 'timestamps', 'usernames', 'room__name'
+    ).filter(room_id=room_id).first()
+    if snapshot is None:
+        return None
+    return {
+        str(user_id): [timestamp, {
+            'room': str(room_id),
+            'room_name': snapshot.room.name,
+            'user': str(user_id),
+            'username': username,
+            'focus_data': score,
+            'status': status,
+            'timestamp': _timestamp_field.to_representation(
+                datetime.fromtimestamp(timestamp, tz=timezone.utc)),
+        }]
+        for user_id, (timestamp, score, status, username) in unpack_snapshot(snapshot).items()
+    }
+
+
+def _data_stream_values(room_id):
+    return {
+        user_id: (timestamp.timestamp(), score, status, username)
+        for user_id, timestamp, score, status, username in DataStream.objects.filter(
+            room_id=room_id
+        ).values_list('user_id', 'timestamp', 'focus_data', 'status', 'user__username')
+    }
+
+
+def update_room_snapshot(room_id, entries):
+    """Merge flushed [timestamp, row, cursor] entries, keyed by user id, into the room's snapshot
+
+    A room without a snapshot starts from its DataStream rows. The row is
+    locked while merging, so concurrent flushers don't lose each other's
+    entries.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                snapshot = RoomFocusSnapshot.objects.select_for_update().filter(
+                    room_id=room_id).first()
+                values = unpack_snapshot(snapshot) if snapshot else _data_stream_values(room_id)
+                for user_id, entry in entries.items():
+                    timestamp, row = entry[0], entry[1]
+                    current = values.get(int(user_id))
+                    if current is None or current[0] <= timestamp:
+                        values[int(user_id)] = (
+                            timestamp, row['focus_data'], row['status'], row['username'])
+
+                if snapshot is None:
+                    RoomFocusSnapshot.objects.create(room_id=room_id, **pack_snapshot(values))
+                else:
+                    for field, value in pack_snapshot(values).items():
+                        setattr(snapshot, field, value)
+                    snapshot.save()
+            return
+        except IntegrityError:
+            # Another flusher created the snapshot meanwhile, merge into theirs
+            if attempt:
+                raise
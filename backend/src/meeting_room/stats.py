@@ -0,0 +1,57 @@
+import logging
+import threading
+from django.conf import settings
+from .broadcast import data_coalescer
+from .codec import dumps
+from .executor import db_executor
+
+logger = logging.getLogger(__name__)
+
+# Stats settings, overridable through settings.PROCESS_STATS
+DEFAULT_INTERVAL = 60  # Seconds between two logs of the stats, None disables them
+
+
+def process_stats():
+    """Get the queue depths, waits and counters of this process's bounded queues"""
+    return {
+        'db_executor': db_executor.stats(),
+        'data_coalescer': data_coalescer.stats(),
+    }
+
+
+class StatsLogger(threading.Thread):
+    """Background thread logging process_stats on an interval"""
+
+    def __init__(self, interval):
+        super().__init__(name='process-stats', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                logger.info(f"Process stats: {dumps(process_stats())}")
+            except Exception as e:
+                logger.error(f"Error logging process stats: {str(e)}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+_stats_logger = None
+_stats_logger_lock = threading.Lock()
+
+
+def start_stats_logger():
+    """Start the periodic stats log of this process once, unless INTERVAL is None"""
+    global _stats_logger
+    if _stats_logger is not None:
+        return
+    with _stats_logger_lock:
+        if _stats_logger is None:
+            interval = getattr(settings, 'PROCESS_STATS', {}).get('INTERVAL', DEFAULT_INTERVAL)
+            if interval is None:
+                _stats_logger = False
+                return
+            _stats_logger = StatsLogger(interval)
+            _stats_logger.start()
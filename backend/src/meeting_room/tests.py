@@ -1,3 +1,720 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .aggregates import ROOM, RoomAggregates, summarize_aggregate, summarize_room_aggregates
+from .analytics import TIMELINE_BUCKETS, summarize_focus
+from .authentication import USER_FIELDS, get_user_for_token, token_cache
+from .broadcast import BroadcastCoalescer
+from .codec import loads
+from .consumers import RoomConsumer
+from .export import CsvExportWriter, ParquetExportWriter, iter_chunks
+from .focus_store import LocalFocusStore, flush_focus_store
+from .ingest import focus_sample_buffer
+from .models import (
+    CustomUser, DataStream, FocusRollup, FocusSample, Room, RoomFocusSnapshot, RoomParticipant,
+)
+from .presence import LocalPresenceStore, presence_user
+from .protocol import (
+    BATCH_HEADER, BATCH_SAMPLE, FRAME_FOCUS_UPDATE, FRAME_SAMPLE, FRAME_SAMPLE_BATCH, SAMPLE,
+    STATUS_CODES, STATUSES, UPDATE_ROW, decode_frame, encode_focus_rows,
+)
+from .rollup import HOUR, MINUTE, get_focus_history, merge_bucket, rollup_focus_history
+from .snapshot import update_room_snapshot
+from .stats import StatsLogger
+from .views import MOVING_WINDOW_CACHE_PERIOD
 
-# Create your tests here.
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+IN_MEMORY_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+}
+LOCAL_PRESENCE = {'BACKEND': 'meeting_room.presence.LocalPresenceStore'}
+
+# Queries a cold request may run: token, room, participant ids, plus the endpoint's own
+QUERY_BUDGETS = {
+    'list_participants': 4,
+    'get_all_focus_data': 4,
+    'get_focus_data': 5,
+    'get_focus_summary': 5,
+    'save_focus_data': 3,
+    'save_focus_data_batch': 6,
+    'get_focus_history': 5,
+    'export_focus_data': 4,
+    'join_room': 8,
+    'leave_room': 6,
+    'get_connected_users': 0,
+    'is_valid_participant': 2,
+    'kick_user': 5,
+    'store_focus_batch': 3,
+}
+
+
+class QueryBudgetMixin:
+    """Build a room with many students and fail when a path exceeds its query budget"""
+    student_count = 20
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+
+        # Keep the write-behind store in memory and the flusher thread off
+        patcher = mock.patch('meeting_room.focus.focus_store', LocalFocusStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('meeting_room.focus.start_focus_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The presence store is built at import, PRESENCE alone doesn't replace it
+        self.presence_store = LocalPresenceStore()
+        for module in ('meeting_room.views', 'meeting_room.consumers'):
+            patcher = mock.patch(f'{module}.presence_store', self.presence_store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Samples buffered by a test belong to its rolled back database
+        self.addCleanup(focus_sample_buffer._take)
+
+        self.teacher = CustomUser.objects.create(username='teacher', role='teacher')
+        self.room = Room.objects.create(name='Room', teacher=self.teacher, meeting_id='budget')
+        self.students = CustomUser.objects.bulk_create([
+            CustomUser(username=f'student{i}', role='student')
+            for i in range(self.student_count)
+        ])
+        RoomParticipant.objects.bulk_create(
+            [RoomParticipant(room=self.room, user=self.teacher)]
+            + [RoomParticipant(room=self.room, user=student) for student in self.students]
+        )
+        DataStream.objects.bulk_create([
+            DataStream(room=self.room, user=student, focus_data=50, status='online')
+            for student in self.students
+        ])
+        # Cold dashboard reads come from the snapshot the flusher keeps
+        update_room_snapshot(self.room.id, {})
+
+        # Signals of the fixtures above must not leave warm entries behind
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    @contextmanager
+    def assertQueryBudget(self, name):
+        with CaptureQueriesContext(connection) as context:
+            yield
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context), QUERY_BUDGETS[name],
+            f"{name} ran {len(context)} queries:\n{queries}")
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE=LOCAL_PRESENCE)
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def test_list_participants(self):
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('list_participants'):
+            response = client.get('/api/classroom/budget/participants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.student_count + 1)
+
+    def test_get_all_focus_data(self):
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('get_all_focus_data'):
+            response = client.get('/api/classroom/budget/get-all-focus-data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), self.student_count)
+
+    def test_get_focus_data(self):
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('get_focus_data'):
+            response = client.get(
+                '/api/classroom/budget/get-focus-data/?student_username=student0')
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_focus_summary(self):
+        FocusSample.objects.bulk_create([
+            FocusSample(room=self.room, user=student, ts=timezone.now(), score=score, status='online')
+            for student in self.students for score in (80, 40)
+        ])
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('get_focus_summary'):
+            response = client.get('/api/classroom/budget/focus-summary/?window=60')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['students']), self.student_count)
+
+    def test_save_focus_data(self):
+        client = self.client_for(self.students[0])
+        with self.assertQueryBudget('save_focus_data'):
+            response = client.post(
+                '/api/classroom/budget/focus-data/',
+                {'focus_data': 80, 'status': 'online'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_save_focus_data_batch(self):
+        client = self.client_for(self.students[0])
+        now = timezone.now()
+        samples = [
+            {'focus_data': score, 'status': 'online',
+             'timestamp': (now - timedelta(seconds=i)).isoformat()}
+            for i, score in enumerate(range(0, 100, 2))
+        ]
+        with self.assertQueryBudget('save_focus_data_batch'):
+            response = client.post(
+                '/api/classroom/budget/focus-data/batch/', {'samples': samples}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['saved'], len(samples))
+
+    def test_get_focus_history(self):
+        FocusSample.objects.bulk_create([
+            FocusSample(room=self.room, user=student, ts=timezone.now(), score=score, status='online')
+            for student in self.students for score in (80, 40)
+        ])
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('get_focus_history'):
+            response = client.get('/api/classroom/budget/focus-history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_export_focus_data(self):
+        client = self.client_for(self.teacher)
+        with self.assertQueryBudget('export_focus_data'):
+            response = client.get('/api/classroom/budget/focus-export/?data=latest')
+            # Rows are read while the response streams
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(content.decode().splitlines()), self.student_count + 1)
+
+    def test_join_room(self):
+        student = CustomUser.objects.create(username='newcomer', role='student')
+        client = self.client_for(student)
+        with self.assertQueryBudget('join_room'):
+            response = client.post('/api/classroom/budget/join/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_leave_room(self):
+        client = self.client_for(self.students[0])
+        with self.assertQueryBudget('leave_room'):
+            response = client.post('/api/classroom/budget/leave/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE=LOCAL_PRESENCE)
+class FocusStoreColdStartTests(QueryBudgetMixin, TestCase):
+
+    def test_write_before_first_read_keeps_other_students(self):
+        # A student writing first must not hide the rows the store never loaded
+        response = self.client_for(self.students[0]).post(
+            '/api/classroom/budget/focus-data/',
+            {'focus_data': 80, 'status': 'online'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client_for(self.teacher).get('/api/classroom/budget/get-all-focus-data/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['user']: row for row in response.json()['results']}
+        self.assertEqual(len(rows), self.student_count)
+        self.assertEqual(rows[str(self.students[0].id)]['focus_data'], 80)
+
+    def test_snapshot_of_unknown_status(self):
+        # Rows stored before statuses were validated must not break every flush
+        DataStream.objects.filter(user=self.students[0]).update(status='away')
+        RoomFocusSnapshot.objects.filter(room=self.room).delete()
+        update_room_snapshot(self.room.id, {})
+
+        response = self.client_for(self.teacher).get('/api/classroom/budget/get-all-focus-data/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['user']: row for row in response.json()['results']}
+        self.assertEqual(rows[str(self.students[0].id)]['status'], 'offline')
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE=LOCAL_PRESENCE)
+class FocusCursorTests(QueryBudgetMixin, TestCase):
+
+    def test_row_stamped_before_the_cursor_is_still_delivered(self):
+        client = self.client_for(self.teacher)
+        cursor = client.get('/api/classroom/budget/get-all-focus-data/').json()['cursor']
+
+        # Stamped before the poll, e.g. by a worker whose clock is behind, stored after it
+        stamp = timezone.now() - timedelta(seconds=10)
+        with mock.patch('meeting_room.focus.timezone.now', return_value=stamp):
+            response = self.client_for(self.students[0]).post(
+                '/api/classroom/budget/focus-data/',
+                {'focus_data': 10, 'status': 'online'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get(f'/api/classroom/budget/get-all-focus-data/?since={cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['user'] for row in response.json()['results']], [str(self.students[0].id)])
+        self.assertGreater(response.json()['cursor'], cursor)
+
+
+class FocusStoreFlushTests(QueryBudgetMixin, TestCase):
+
+    def test_failed_flush_keeps_entries_dirty(self):
+        store = LocalFocusStore()
+        user_id = str(self.students[0].id)
+        row = {'focus_data': 80, 'status': 'online', 'username': 'student0'}
+        store.put(self.room.id, user_id, [1000.0, row, 1])
+
+        locked = OperationalError('database is locked')
+        with mock.patch.object(DataStream.objects, 'bulk_create', side_effect=locked):
+            flush_focus_store(store)
+
+        flush_focus_store(store)
+        self.assertEqual(DataStream.objects.get(user_id=user_id).focus_data, 80)
+        self.assertEqual(store.pop_dirty(), {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TokenCacheTests(QueryBudgetMixin, TestCase):
+
+    def test_lookup_racing_a_deletion_is_not_cached(self):
+        token = Token.objects.create(user=self.students[0])
+        key = token.key
+        real_filter = Token.objects.filter
+
+        def filter_then_delete(**kwargs):
+            # The row is read, then the token is deleted before the lookup caches it
+            row = real_filter(**kwargs).values(*(f'user__{field}' for field in USER_FIELDS)).first()
+            token.delete()
+            return mock.Mock(**{'values.return_value.first.return_value': row})
+
+        with mock.patch.object(Token.objects, 'filter', side_effect=filter_then_delete):
+            self.assertIsNotNone(get_user_for_token(key))
+        self.assertIsNone(get_user_for_token(key))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE=LOCAL_PRESENCE)
+class ResponseCacheTests(QueryBudgetMixin, TestCase):
+
+    def test_views_of_one_namespace_are_cached_apart(self):
+        client = self.client_for(self.teacher)
+        summary = client.get('/api/classroom/budget/focus-summary/')
+        self.assertEqual(summary.status_code, 200)
+        self.assertIn('timeline', summary.json())
+
+        # Same focus generation, no query string
+        response = client.get('/api/classroom/budget/get-all-focus-data/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), self.student_count)
+        self.assertNotEqual(response['ETag'], summary['ETag'])
+
+        response = client.get(
+            '/api/classroom/budget/get-all-focus-data/', HTTP_IF_NONE_MATCH=summary['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_answers_304_until_the_next_write(self):
+        client = self.client_for(self.teacher)
+        first = client.get('/api/classroom/budget/get-all-focus-data/')
+        response = client.get(
+            '/api/classroom/budget/get-all-focus-data/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.client_for(self.students[0]).post(
+            '/api/classroom/budget/focus-data/', {'focus_data': 10, 'status': 'online'}, format='json')
+        response = client.get(
+            '/api/classroom/budget/get-all-focus-data/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        rows = {row['user']: row for row in response.json()['results']}
+        self.assertEqual(rows[str(self.students[0].id)]['focus_data'], 10)
+
+    def test_forged_etag_does_not_skip_the_view(self):
+        # ETags are predictable, a student must not get a 304 from a teacher-only view
+        client = self.client_for(self.teacher)
+        etag = client.get('/api/classroom/budget/get-all-focus-data/')['ETag']
+        forged = etag.replace('-teacher-', '-student-')
+
+        response = self.client_for(self.students[0]).get(
+            '/api/classroom/budget/get-all-focus-data/', HTTP_IF_NONE_MATCH=forged)
+        self.assertEqual(response.status_code, 403)
+
+    def test_focus_summary_follows_the_clock(self):
+        client = self.client_for(self.teacher)
+        with mock.patch('meeting_room.decorators.time') as clock:
+            clock.time.return_value = 1000.0
+            first = client.get('/api/classroom/budget/focus-summary/')
+            response = client.get(
+                '/api/classroom/budget/focus-summary/', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            # No write since, but the window moved on
+            clock.time.return_value = 1000.0 + MOVING_WINDOW_CACHE_PERIOD
+            response = client.get(
+                '/api/classroom/budget/focus-summary/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_focus_history_after_other_focus_views(self):
+        client = self.client_for(self.teacher)
+        client.get('/api/classroom/budget/get-all-focus-data/')
+        client.get('/api/classroom/budget/focus-summary/')
+
+        response = client.get('/api/classroom/budget/focus-history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'start', 'end', 'resolution', 'results'})
+
+    def test_focus_history_follows_the_clock(self):
+        client = self.client_for(self.teacher)
+        with mock.patch('meeting_room.decorators.time') as clock:
+            clock.time.return_value = 1000.0
+            first = client.get('/api/classroom/budget/focus-history/')
+            # Without an end the range ends now
+            clock.time.return_value = 1000.0 + MOVING_WINDOW_CACHE_PERIOD
+            response = client.get(
+                '/api/classroom/budget/focus-history/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['end'], first.json()['end'])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, PRESENCE=LOCAL_PRESENCE)
+class ConsumerQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+
+    def consumer_for(self, user):
+        consumer = RoomConsumer()
+        consumer.meeting_id = self.room.meeting_id
+        consumer.user = user
+        return consumer
+
+    def test_get_connected_users(self):
+        for i, user in enumerate([self.teacher] + self.students):
+            self.presence_store.join(self.room.meeting_id, f'channel{i}', presence_user(user))
+        consumer = self.consumer_for(self.teacher)
+        with self.assertQueryBudget('get_connected_users'):
+            users = async_to_sync(consumer.get_connected_users)()
+        self.assertEqual(len(users), self.student_count + 1)
+
+    def test_is_valid_participant(self):
+        consumer = self.consumer_for(self.students[0])
+        with self.assertQueryBudget('is_valid_participant'):
+            # The sync body, db_executor threads use connections this one doesn't capture
+            self.assertTrue(consumer.is_valid_participant.__wrapped__(consumer))
+
+    def test_kick_user(self):
+        consumer = self.consumer_for(self.teacher)
+        self.assertTrue(consumer.is_valid_participant.__wrapped__(consumer))
+        with self.assertQueryBudget('kick_user'):
+            success, _ = consumer.kick_user.__wrapped__(consumer, self.students[0].id)
+        self.assertTrue(success)
+
+    def test_store_focus_batch(self):
+        consumer = self.consumer_for(self.students[0])
+        self.assertTrue(consumer.is_valid_participant.__wrapped__(consumer))
+        now = timezone.now()
+        samples = [
+            {'focus_data': score, 'status': 'online',
+             'timestamp': (now - timedelta(seconds=i)).isoformat()}
+            for i, score in enumerate(range(0, 100, 2))
+        ]
+        with self.assertQueryBudget('store_focus_batch'):
+            rows = consumer.store_focus_batch.__wrapped__(consumer, samples)
+        self.assertEqual(len(rows), 1)
+
+    def test_membership_changed_closes_removed_user(self):
+        consumer = self.consumer_for(self.students[0])
+        self.assertTrue(consumer.is_valid_participant.__wrapped__(consumer))
+        consumer.is_room_teacher = False
+        # Every worker reads the members the kick just invalidated
+        RoomParticipant.objects.filter(room=self.room, user=self.students[0]).delete()
+
+        consumer.close = mock.AsyncMock()
+        async_to_sync(consumer.membership_changed)({'type': 'membership_changed'})
+        consumer.close.assert_awaited_once()
+
+
+class StatsLoggerTests(SimpleTestCase):
+
+    def test_logs_the_executor_stats(self):
+        stats_logger = StatsLogger(0.01)
+        with self.assertLogs('meeting_room.stats', 'INFO') as logs:
+            stats_logger.start()
+            time.sleep(0.1)
+            stats_logger.stop()
+            stats_logger.join()
+        self.assertIn('"db_executor"', logs.output[0])
+
+
+class BroadcastCoalescerTests(SimpleTestCase):
+
+    def test_window_batches_every_frame_of_a_sender(self):
+        layer = mock.AsyncMock()
+        coalescer = BroadcastCoalescer(window_ms=10)
+        user = mock.Mock(id=1, username='student')
+
+        async def send():
+            for n in range(3):
+                self.assertTrue(await coalescer.add(layer, 'room', user, {'n': n}))
+            await asyncio.sleep(0.05)
+        asyncio.run(send())
+
+        layer.group_send.assert_awaited_once()
+        group, event = layer.group_send.await_args.args
+        self.assertEqual(group, 'room')
+        frames = loads(event['text'])['frames']
+        self.assertEqual([frame['data']['n'] for frame in frames], [0, 1, 2])
+        self.assertEqual(coalescer.stats()['sent'], 3)
+
+    def test_rate_limit_and_pending_bound(self):
+        layer = mock.AsyncMock()
+        coalescer = BroadcastCoalescer(window_ms=10, rate=1, burst=2, max_pending=3)
+        users = [mock.Mock(id=i, username=f'student{i}') for i in range(3)]
+
+        async def send():
+            # Two frames of the burst go through, the third waits for a token
+            results = [await coalescer.add(layer, 'room', users[0], {}) for _ in range(3)]
+            # The room is full once it holds max_pending frames
+            results += [await coalescer.add(layer, 'room', user, {}) for user in users[1:]]
+            await asyncio.sleep(0.05)
+            return results
+        self.assertEqual(asyncio.run(send()), [True, True, False, True, False])
+
+        stats = coalescer.stats()
+        self.assertEqual((stats['rate_limited'], stats['dropped'], stats['sent']), (1, 1, 3))
+
+
+class ProtocolTests(SimpleTestCase):
+
+    def test_decode_sample(self):
+        kind, samples = decode_frame(SAMPLE.pack(FRAME_SAMPLE, 72, STATUS_CODES['online']))
+        self.assertEqual(kind, FRAME_SAMPLE)
+        self.assertEqual(samples, [{'focus_data': 72.0, 'status': 'online'}])
+
+    def test_decode_batch_orders_samples(self):
+        base = 1_700_000_000.0
+        frame = BATCH_HEADER.pack(FRAME_SAMPLE_BATCH, base, 2) + b''.join([
+            BATCH_SAMPLE.pack(1500, 40, STATUS_CODES['offline']),
+            BATCH_SAMPLE.pack(0, 90, STATUS_CODES['online']),
+        ])
+        kind, samples = decode_frame(frame)
+        self.assertEqual(kind, FRAME_SAMPLE_BATCH)
+        self.assertEqual([sample['focus_data'] for sample in samples], [90.0, 40.0])
+        self.assertEqual(samples[1]['timestamp'].timestamp(), base + 1.5)
+        self.assertEqual(samples[1]['status'], 'offline')
+
+    def test_decode_malformed_frames(self):
+        header = BATCH_HEADER.pack(FRAME_SAMPLE_BATCH, 0, 2)
+        frames = {
+            'empty': b'',
+            'unknown kind': bytes([0x7f, 1, 0]),
+            'truncated sample': bytes([FRAME_SAMPLE, 50]),
+            'unknown status': SAMPLE.pack(FRAME_SAMPLE, 50, len(STATUSES)),
+            'truncated header': header[:5],
+            'empty batch': BATCH_HEADER.pack(FRAME_SAMPLE_BATCH, 0, 0),
+            'count mismatch': header + BATCH_SAMPLE.pack(0, 50, 0),
+            'huge base': (BATCH_HEADER.pack(FRAME_SAMPLE_BATCH, 1e300, 1)
+                          + BATCH_SAMPLE.pack(0, 50, 0)),
+        }
+        for name, frame in frames.items():
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    decode_frame(frame)
+
+    def test_encode_focus_rows_round_trip(self):
+        rows = [
+            {'user': '7', 'timestamp': '2026-01-01T00:00:01.250000Z',
+             'focus_data': 80.4, 'status': 'online'},
+            {'user': '3', 'timestamp': '2026-01-01T00:00:00Z',
+             'focus_data': 300, 'status': 'offline'},
+            {'user': '5', 'timestamp': '2026-01-01T00:00:02Z',
+             'focus_data': 10, 'status': 'away'},
+        ]
+        frame = encode_focus_rows(rows)
+        kind, base, count = BATCH_HEADER.unpack_from(frame)
+        self.assertEqual((kind, count), (FRAME_FOCUS_UPDATE, 3))
+        self.assertEqual(base, datetime.fromisoformat(rows[1]['timestamp']).timestamp())
+        self.assertEqual(list(UPDATE_ROW.iter_unpack(frame[BATCH_HEADER.size:])), [
+            (7, 1250, 80, STATUS_CODES['online']),
+            # Scores are clamped to a byte, unknown statuses count as offline
+            (3, 0, 255, STATUS_CODES['offline']),
+            (5, 2000, 10, STATUS_CODES['offline']),
+        ])
+
+    def test_encode_no_rows(self):
+        self.assertEqual(BATCH_HEADER.unpack(encode_focus_rows([])), (FRAME_FOCUS_UPDATE, 0, 0))
+
+
+class PresenceStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.store = LocalPresenceStore(TTL=30)
+        self.alice = {'user_id': 1, 'username': 'alice', 'role': 'student'}
+
+    def test_tabs_of_one_user(self):
+        self.assertTrue(self.store.join('room', 'tab1', self.alice))
+        self.assertFalse(self.store.join('room', 'tab2', self.alice))
+        self.assertEqual(self.store.snapshot('room'), [self.alice])
+        # Only the last tab leaving makes the user absent
+        self.assertIsNone(self.store.leave('room', 'tab1'))
+        self.assertEqual(self.store.leave('room', 'tab2'), self.alice)
+        self.assertEqual(self.store.snapshot('room'), [])
+
+    def test_connections_expire_without_heartbeat(self):
+        with mock.patch('meeting_room.presence.time.time', return_value=1000.0):
+            self.store.join('room', 'tab1', self.alice)
+        with mock.patch('meeting_room.presence.time.time', return_value=1020.0):
+            self.assertTrue(self.store.touch('room', 'tab1'))
+        with mock.patch('meeting_room.presence.time.time', return_value=1049.0):
+            self.assertEqual(self.store.prune('room'), [])
+        with mock.patch('meeting_room.presence.time.time', return_value=1050.0):
+            self.assertFalse(self.store.touch('room', 'tab1'))
+            self.assertEqual(self.store.prune('room'), [self.alice])
+            self.assertEqual(self.store.snapshot('room'), [])
+
+
+class AggregateTests(SimpleTestCase):
+
+    def test_summary_matches_numpy(self):
+        scores = [12.5, 40, 40, 77, 99.5, 100]
+        aggregates = RoomAggregates()
+        for score in scores:
+            aggregates.record('1', score)
+        aggregates.record('2', 60)
+
+        vectors = aggregates.vectors()
+        student = summarize_aggregate(vectors['1'])
+        self.assertEqual(student['count'], len(scores))
+        self.assertEqual(student['mean'], round(float(np.mean(scores)), 2))
+        self.assertEqual(student['stddev'], round(float(np.std(scores)), 2))
+        self.assertEqual(student['histogram'], [0, 1, 0, 0, 2, 0, 0, 1, 0, 2])
+        self.assertEqual(summarize_aggregate(vectors[ROOM])['count'], len(scores) + 1)
+
+    def test_empty_aggregate(self):
+        self.assertEqual(summarize_room_aggregates({})['room']['count'], 0)
+
+
+class RollupTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        # Old enough to be compacted, recent enough to keep its minute buckets
+        self.minute = (self.now - timedelta(days=2)).replace(second=0, microsecond=0)
+        self.student = self.students[0]
+
+    def sample(self, seconds, score, status='online'):
+        return FocusSample(
+            room=self.room, user=self.student, ts=self.minute + timedelta(seconds=seconds),
+            score=score, status=status)
+
+    def rollup(self, resolution):
+        return FocusRollup.objects.get(room=self.room, user=self.student, resolution=resolution)
+
+    def test_merge_bucket(self):
+        merged = merge_bucket({'count': 2, 'min': 40, 'max': 80, 'mean': 60},
+                              {'count': 1, 'min': 30, 'max': 30, 'mean': 30})
+        self.assertEqual(merged, {'count': 3, 'min': 30, 'max': 80, 'mean': 50})
+
+    def test_late_samples_merge_into_compacted_buckets(self):
+        FocusSample.objects.bulk_create([
+            self.sample(5, 40), self.sample(20, 80), self.sample(30, 0, status='offline')])
+        result = rollup_focus_history(now=self.now)
+        self.assertEqual(result, {'samples': 3, 'buckets': 2, 'expired': 0})
+        self.assertFalse(FocusSample.objects.exists())
+        self.assertEqual(self.rollup(MINUTE).count, 2)
+
+        # E.g. a batch with old client timestamps arriving after the rollup
+        FocusSample.objects.bulk_create([self.sample(40, 90)])
+        rollup_focus_history(now=self.now)
+        for resolution in (MINUTE, HOUR):
+            rollup = self.rollup(resolution)
+            self.assertEqual((rollup.count, rollup.min, rollup.max, rollup.mean), (3, 40, 90, 70))
+
+    def test_history_merges_rollups_and_raw_samples(self):
+        FocusSample.objects.bulk_create([self.sample(5, 40), self.sample(20, 80)])
+        rollup_focus_history(now=self.now)
+        FocusSample.objects.bulk_create([self.sample(50, 100)])
+
+        resolution, buckets = get_focus_history(
+            self.room.id, self.minute - timedelta(minutes=1), self.minute + timedelta(minutes=2))
+        self.assertEqual(resolution, MINUTE)
+        self.assertEqual(buckets, [{
+            'bucket': self.minute.isoformat(), 'count': 3, 'min': 40, 'max': 100, 'mean': 73.33}])
+
+
+class AnalyticsTests(QueryBudgetMixin, TestCase):
+
+    def test_summarize_focus(self):
+        first, second = self.students[0].id, self.students[1].id
+        history = {
+            'user_id': np.array([first, first, first, second]),
+            'ts': np.array([0.0, 10.0, 20.0, 5.0]),
+            'score': np.array([80.0, 30.0, 20.0, 0.0]),
+            'online': np.array([True, True, True, False]),
+        }
+        summary = summarize_focus(history, 0, 60)
+
+        self.assertEqual(summary['room']['students'], 1)
+        self.assertEqual(summary['room']['samples'], 3)
+        self.assertEqual(summary['room']['drops'], 1)
+        # 30 holds for 10 seconds until the next sample, 20 for the rest of the window
+        self.assertEqual(summary['room']['time_below_threshold'], 50.0)
+
+        student = summary['students'][0]
+        self.assertEqual(student['username'], 'student0')
+        self.assertEqual(student['mean'], 43.33)
+        self.assertEqual(student['p10'], round(float(np.percentile([80, 30, 20], 10)), 2))
+        self.assertEqual(student['p50'], 30.0)
+        self.assertEqual(summary['students'][1]['samples'], 0)
+        self.assertIsNone(summary['students'][1]['mean'])
+
+        self.assertEqual(len(summary['drop_events']), 1)
+        drop = summary['drop_events'][0]
+        self.assertEqual((drop['from'], drop['to']), (80.0, 30.0))
+        self.assertEqual(len(summary['timeline']), TIMELINE_BUCKETS)
+
+
+class ExportWriterTests(SimpleTestCase):
+    columns = [('user_id', 'int'), ('ts', 'datetime'), ('score', 'float')]
+
+    def rows(self):
+        start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        return [(user_id, start + timedelta(seconds=user_id), user_id / 2) for user_id in range(5)]
+
+    def test_iter_chunks(self):
+        self.assertEqual([len(chunk) for chunk in iter_chunks(range(5), 2)], [2, 2, 1])
+
+    def test_csv(self):
+        parts = list(CsvExportWriter().write(self.columns, iter_chunks(self.rows(), 2)))
+        lines = ''.join(parts).splitlines()
+        self.assertEqual(lines[0], 'user_id,ts,score')
+        self.assertEqual(lines[2], '1,2026-01-01T00:00:01+00:00,0.5')
+        self.assertEqual(len(lines), 6)
+
+    def test_csv_without_rows_is_a_header(self):
+        parts = CsvExportWriter().write(self.columns, iter([]))
+        self.assertEqual(''.join(parts), 'user_id,ts,score\r\n')
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        parts = ParquetExportWriter().write(self.columns, iter_chunks(self.rows(), 2))
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(parts)))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('score').to_pylist(), [row[2] for row in self.rows()])
+        self.assertEqual(table.column('ts').to_pylist(), [row[1] for row in self.rows()])
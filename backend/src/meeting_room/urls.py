@@ -8,9 +8,14 @@ from .views import (
     leave_room,
     deactivate_room,
     list_participants,
+    list_present_users,
     save_focus_data,
+    save_focus_data_batch,
     get_focus_data,
-    get_all_focus_data
+    get_all_focus_data,
+    get_focus_summary_data,
+    get_focus_history_data,
+    export_focus_data
 )
 
 router = DefaultRouter()
@@ -25,7 +30,12 @@ urlpatterns = [
     path('classroom/<str:meeting_id>/leave/', leave_room, name='leave-room'),
     path('classroom/<str:meeting_id>/deactivate/', deactivate_room, name='deactivate-room'),
     path('classroom/<str:meeting_id>/participants/', list_participants, name='list-participants'),
+    path('classroom/<str:meeting_id>/presence/', list_present_users, name='list-present-users'),
     path('classroom/<str:meeting_id>/focus-data/', save_focus_data, name='save-focus-data'),
+    path('classroom/<str:meeting_id>/focus-data/batch/', save_focus_data_batch, name='save-focus-data-batch'),
     path('classroom/<str:meeting_id>/get-focus-data/', get_focus_data, name='get-focus-data'),
     path('classroom/<str:meeting_id>/get-all-focus-data/', get_all_focus_data, name='get-all-focus-data'),
+    path('classroom/<str:meeting_id>/focus-summary/', get_focus_summary_data, name='focus-summary'),
+    path('classroom/<str:meeting_id>/focus-history/', get_focus_history_data, name='focus-history'),
+    path('classroom/<str:meeting_id>/focus-export/', export_focus_data, name='focus-export'),
 ]
@@ -1,29 +1,51 @@
 from rest_framework import status
-from .models import Room, RoomParticipant, DataStream, CustomUser
-from .serializers import RoomSerializer, RoomParticipantSerializer, DataStreamSerializer
-from django.db import transaction
+from .models import Room, RoomParticipant, CustomUser, FOCUS_STATUSES
+from .serializers import RoomSerializer, RoomParticipantSerializer, FocusBatchSerializer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from .serializers import CustomUserSerializer
 import logging
-from django.core.cache import cache
-import json
+from datetime import timedelta
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from .models import Room, RoomParticipant
-from django.core.serializers.json import DjangoJSONEncoder
+from .focus import (
+    save_focus_sample,
+    save_focus_samples,
+    broadcast_focus_update,
+    get_room_focus_entries,
+    get_room_focus_changes,
+    get_room_focus_summary,
+    parse_focus_cursor,
+    parse_timestamp
+)
+from .membership import get_room_members
+from .presence import presence_store
+from .caching import get_room_generation, get_or_build
+from .decorators import cache_room_response
+from .analytics import DEFAULT_WINDOW, MIN_WINDOW, MAX_WINDOW, get_focus_summary
+from .rollup import get_focus_history
+from .export import DATASETS, EXPORT_WRITERS, aiter_sync, export_room
 
 logger = logging.getLogger(__name__)
 
+FOCUS_STATUS_VALUES = [value for value, _ in FOCUS_STATUSES]
+
 # Cache settings
 FOCUS_DATA_CACHE_TIMEOUT = 60  # Cache for 1 minute
+MOVING_WINDOW_CACHE_PERIOD = 5  # Seconds a view whose window ends now may lag the clock
+
+DEFAULT_HISTORY_RANGE = timedelta(hours=1)  # Range of focus history when no start is given
 
 
-def get_cache_key(room_id, user_id=None):
-    """Generate cache key for focus data"""
+def get_cache_key(room_id, generation, user_id=None):
+    """Generate cache key for focus data of a room generation"""
     if user_id:
-        return f"focus_data_{room_id}_{user_id}"
-    return f"focus_data_{room_id}_all"
+        return f"focus_data_{room_id}_{user_id}_{generation}"
+    return f"focus_data_{room_id}_all_{generation}"
 
 
 @api_view(['POST'])
@@ -107,48 +129,56 @@ def create_room(request):
 def join_room(request, meeting_id):
     """Join a room using meeting_id"""
     try:
-        # Fetch the room by meeting_id
-        room = Room.objects.get(meeting_id=meeting_id)
+        # Fetch the room by meeting_id from the membership cache
+        members = get_room_members(meeting_id)
+        if members is None:
+            raise Room.DoesNotExist
 
         # Check if room is active
-        if not room.is_active:
+        if not members['is_active']:
             return Response(
                 {"error": "This room is no longer active"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         # Check if user is the teacher of this room
-        if room.teacher == request.user:
+        if members['teacher_id'] == request.user.id:
             return Response(
                 {"error": "You are the teacher of this room. Please use the teacher dashboard."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with transaction.atomic():
-            participant, created = RoomParticipant.objects.get_or_create(
-                room=room,
-                user=request.user,
-                defaults={'is_tracking': True}
+        if request.user.id in members['participant_ids']:
+            return Response(
+                {"detail": "Already joined this room"},
+                status=status.HTTP_200_OK
             )
 
-            if not created:
-                return Response(
-                    {"detail": "Already joined this room"},
-                    status=status.HTTP_200_OK
-                )
+        # The participant signal refreshes the membership cache
+        participant, created = RoomParticipant.objects.get_or_create(
+            room_id=members['room_id'],
+            user=request.user,
+            defaults={'is_tracking': True}
+        )
 
+        if not created:
             return Response(
-                {
-                    "detail": "Successfully joined the room",
-                    "room": {
-                        "meeting_id": room.meeting_id,
-                        "name": room.name,
-                        "teacher": room.teacher.username
-                    }
-                },
-                status=status.HTTP_201_CREATED
+                {"detail": "Already joined this room"},
+                status=status.HTTP_200_OK
             )
 
+        return Response(
+            {
+                "detail": "Successfully joined the room",
+                "room": {
+                    "meeting_id": meeting_id,
+                    "name": members['name'],
+                    "teacher": members['teacher_username']
+                }
+            },
+            status=status.HTTP_201_CREATED
+        )
+
     except Room.DoesNotExist:
         return Response(
             {"error": "Room does not exist"},
@@ -160,15 +190,18 @@ def join_room(request, meeting_id):
 @permission_classes([IsAuthenticated])
 def leave_room(request, meeting_id):
     """Leave a room"""
-    try:
-        room = Room.objects.get(meeting_id=meeting_id)
-        participant = RoomParticipant.objects.get(room=room, user=request.user)
-        participant.delete()
-        return Response({"detail": "Successfully left the room"}, status=status.HTTP_200_OK)
-    except Room.DoesNotExist:
+    members = get_room_members(meeting_id)
+    if members is None:
         return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
-    except RoomParticipant.DoesNotExist:
+    if request.user.id not in members['participant_ids']:
+        return Response({"error": "You are not in this room"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The participant signal refreshes the membership cache
+    deleted, _ = RoomParticipant.objects.filter(
+        room_id=members['room_id'], user=request.user).delete()
+    if not deleted:
         return Response({"error": "You are not in this room"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"detail": "Successfully left the room"}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -187,18 +220,38 @@ def deactivate_room(request, meeting_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_room_response('participants')
 def list_participants(request, meeting_id):
     """List all participants in a room"""
-    try:
-        room = Room.objects.get(meeting_id=meeting_id)
-    except Room.DoesNotExist:
+    members = get_room_members(meeting_id)
+    if members is None:
         return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    participants = RoomParticipant.objects.filter(room=room)
+    # Fetch the usernames with the participants instead of one query per row
+    participants = RoomParticipant.objects.filter(
+        room_id=members['room_id']
+    ).select_related('user').only('user__username', 'joined_at', 'is_tracking')
     serializer = RoomParticipantSerializer(participants, many=True)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_present_users(request, meeting_id):
+    """List the users currently connected to a room"""
+    members = get_room_members(meeting_id)
+    if members is None:
+        return Response({"error": "Room not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.user.id not in members['participant_ids']:
+        return Response(
+            {"error": "You are not a participant in this room"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response(presence_store.snapshot(meeting_id))
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_focus_data(request, meeting_id):
@@ -214,6 +267,13 @@ def save_focus_data(request, meeting_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Dashboards and binary frames only know the model's statuses
+        if _status not in FOCUS_STATUS_VALUES:
+            return Response(
+                {"error": f"status must be one of {', '.join(FOCUS_STATUS_VALUES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # Only students can save their own focus data
         if request.user.role != 'student':
             return Response(
@@ -221,31 +281,29 @@ def save_focus_data(request, meeting_id):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Use select_for_update to prevent race conditions
-        with transaction.atomic():
-            room = Room.objects.select_for_update().get(meeting_id=meeting_id)
-
-            # Check if user is in the room
-            if not RoomParticipant.objects.filter(room=room, user=request.user).exists():
-                return Response(
-                    {"error": "You are not in this room"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Use update_or_create with select_for_update to handle concurrency
-            data_stream, created = DataStream.objects.select_for_update().update_or_create(
-                room=room,
-                user=request.user,
-                defaults={
-                    'focus_data': float(focus_data),
-                    'status': _status
-                }
+        # Participation is checked against the cached membership set
+        members = get_room_members(meeting_id)
+        if members is None:
+            raise Room.DoesNotExist
+
+        # Check if user is in the room
+        if request.user.id not in members['participant_ids']:
+            return Response(
+                {"error": "You are not in this room"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Written behind to the focus store, no database access on the hot path
+        row = save_focus_sample(
+            members['room_id'], members['name'], request.user, focus_data, _status)
+
+        # Push the changed row to subscribed teacher dashboards
+        broadcast_focus_update(meeting_id, [row])
+
         # Return minimal response to reduce bandwidth
         return Response(
-            {"detail": "Saved data successfully", "created": created},
-            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+            {"detail": "Saved data successfully"},
+            status=status.HTTP_200_OK
         )
 
     except Room.DoesNotExist:
@@ -267,12 +325,65 @@ def save_focus_data(request, meeting_id):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def save_focus_data_batch(request, meeting_id):
+    """Save a batch of timestamped focus samples for a student"""
+    # Only students can save their own focus data
+    if request.user.role != 'student':
+        return Response(
+            {"error": "Only students can save their own focus data"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    serializer = FocusBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    samples = serializer.validated_data['samples']
+
+    members = get_room_members(meeting_id)
+    if members is None:
+        return Response(
+            {"error": "Room not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Check if user is in the room
+    if request.user.id not in members['participant_ids']:
+        return Response(
+            {"error": "You are not in this room"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        row = save_focus_samples(
+            members['room_id'], members['name'], request.user, samples)
+    except Exception as e:
+        # Log the error for debugging
+        logger.error(f"Error saving focus data batch: {str(e)}")
+        return Response(
+            {"error": "Internal server error"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    # Push the new latest row to subscribed teacher dashboards
+    broadcast_focus_update(meeting_id, [row])
+
+    return Response(
+        {"detail": "Saved data successfully", "saved": len(samples)},
+        status=status.HTTP_200_OK
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_focus_data(request, meeting_id):
     """Get focus data for a specific student"""
     try:
-        room = Room.objects.get(meeting_id=meeting_id)
+        members = get_room_members(meeting_id)
+        if members is None:
+            raise Room.DoesNotExist
+        room_id = members['room_id']
         student_username = request.query_params.get('student_username')
 
         if not student_username:
@@ -297,35 +408,33 @@ def get_focus_data(request, meeting_id):
             )
 
         # Check if student is in the room
-        if not RoomParticipant.objects.filter(room=room, user=student).exists():
+        if student.id not in members['participant_ids']:
             return Response(
                 {"error": "Student is not in this room"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Try to get from cache first
-        cache_key = get_cache_key(room.id, student.id)
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(json.loads(cached_data))
-
-        # If not in cache, get from database
-        data_stream = DataStream.objects.filter(
-            room=room, user=student).order_by('-timestamp').first()
-        if not data_stream:
+        def build():
+            entry = get_room_focus_entries(room_id).get(str(student.id))
+            if not entry:
+                return None
+            return dict(entry[1], user=student.id)
+
+        # Cached per room generation, every save moves the room to a new one
+        generation = get_room_generation(room_id)
+        cached_data = get_or_build(
+            get_cache_key(room_id, generation, student.id),
+            build,
+            FOCUS_DATA_CACHE_TIMEOUT,
+            stale_key=get_cache_key(room_id, 'latest', student.id)
+        )
+        if not cached_data:
             return Response(
                 {"error": "No focus data found for this student"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        serializer = DataStreamSerializer(data_stream)
-        response_data = serializer.data
-
-        # Cache the result
-        cache.set(cache_key, json.dumps(response_data),
-                  FOCUS_DATA_CACHE_TIMEOUT)
-
-        return Response(response_data)
+        return Response(cached_data)
 
     except Room.DoesNotExist:
         return Response(
@@ -336,45 +445,169 @@ def get_focus_data(request, meeting_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_room_response('focus')
 def get_all_focus_data(request, meeting_id):
     """Get focus data for all students in a room"""
+    # Only teachers can view focus data
+    if request.user.role != 'teacher':
+        return Response(
+            {"error": "Only teachers can view focus data"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    members = get_room_members(meeting_id)
+    if members is None:
+        return Response(
+            {"error": "Room not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Pollers pass back the cursor to get only the rows that changed since
     try:
-        room = Room.objects.get(meeting_id=meeting_id)
+        since = parse_focus_cursor(request.query_params.get('since'))
+    except ValueError:
+        return Response(
+            {"error": "since must be a cursor or an ISO 8601 timestamp"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-        # Only teachers can view focus data
-        if request.user.role != 'teacher':
-            return Response(
-                {"error": "Only teachers can view focus data"},
-                status=status.HTTP_403_FORBIDDEN
-            )
+    # cache_room_response rebuilds this at most once per room generation
+    rows, cursor = get_room_focus_changes(members['room_id'], since)
+    return Response({
+        "cursor": cursor,
+        "results": rows,
+        "summary": get_room_focus_summary(members['room_id'])
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_room_response('focus', period=MOVING_WINDOW_CACHE_PERIOD)
+def get_focus_summary_data(request, meeting_id):
+    """Get focus statistics of a room and its students over a recent window"""
+    # Only teachers can view focus data
+    if request.user.role != 'teacher':
+        return Response(
+            {"error": "Only teachers can view focus data"},
+            status=status.HTTP_403_FORBIDDEN
+        )
 
-        # Try to get from cache first
-        cache_key = get_cache_key(room.id)
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(json.loads(cached_data))
+    members = get_room_members(meeting_id)
+    if members is None:
+        return Response(
+            {"error": "Room not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
-        # Get the latest focus data for each student
-        data_streams = DataStream.objects.filter(
-            room=room
-        ).order_by('-timestamp')
-        
-        serializer = DataStreamSerializer(data_streams, many=True)
-        response_data = serializer.data
+    try:
+        window = int(request.query_params.get('window', DEFAULT_WINDOW))
+    except ValueError:
+        window = None
+    if window is None or not MIN_WINDOW <= window <= MAX_WINDOW:
+        return Response(
+            {"error": f"window must be a number of seconds from {MIN_WINDOW} to {MAX_WINDOW}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-        # Convert UUIDs to strings
-        for item in response_data:
-            item['room'] = str(item['room'])
-            item['user'] = str(item['user'])
+    # cache_room_response memoizes this per room, window, generation and period
+    return Response(get_focus_summary(members['room_id'], window))
 
-        # Cache the result
-        cache.set(cache_key, json.dumps(response_data),
-                  FOCUS_DATA_CACHE_TIMEOUT)
 
-        return Response(response_data)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_room_response('focus', period=MOVING_WINDOW_CACHE_PERIOD)
+def get_focus_history_data(request, meeting_id):
+    """Get the bucketed focus of a room or a student over a time range"""
+    # Only teachers can view focus data
+    if request.user.role != 'teacher':
+        return Response(
+            {"error": "Only teachers can view focus data"},
+            status=status.HTTP_403_FORBIDDEN
+        )
 
-    except Room.DoesNotExist:
+    members = get_room_members(meeting_id)
+    if members is None:
         return Response(
             {"error": "Room not found"},
             status=status.HTTP_404_NOT_FOUND
-        )
\ No newline at end of file
+        )
+
+    try:
+        end = request.query_params.get('end')
+        end = parse_timestamp(end) if end else timezone.now()
+        start = request.query_params.get('start')
+        start = parse_timestamp(start) if start else end - DEFAULT_HISTORY_RANGE
+    except ValueError:
+        return Response(
+            {"error": "start and end must be ISO 8601 timestamps"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if start >= end:
+        return Response(
+            {"error": "start must be before end"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    user_id = None
+    student_username = request.query_params.get('student_username')
+    if student_username:
+        user_id = CustomUser.objects.filter(
+            username=student_username).values_list('id', flat=True).first()
+        if user_id not in members['participant_ids']:
+            return Response(
+                {"error": "Student is not in this room"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    # The resolution follows the range, minutes up to a day, hours beyond
+    resolution, buckets = get_focus_history(members['room_id'], start, end, user_id)
+    return Response({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "resolution": resolution,
+        "results": buckets
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_focus_data(request, meeting_id):
+    """Stream the focus data of a room as a CSV or Parquet file"""
+    members = get_room_members(meeting_id)
+    if members is None:
+        return Response(
+            {"error": "Room not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Only the room's teacher can export its focus data
+    if request.user.id != members['teacher_id']:
+        return Response(
+            {"error": "Only the teacher of this room can export its focus data"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    dataset = request.query_params.get('data', 'history')
+    output = request.query_params.get('output', 'csv')
+    if dataset not in DATASETS or output not in EXPORT_WRITERS:
+        return Response(
+            {"error": f"data must be one of {', '.join(DATASETS)} "
+                      f"and output one of {', '.join(EXPORT_WRITERS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        writer = EXPORT_WRITERS[output]()
+    except ImportError:
+        return Response(
+            {"error": f"{output} export is not available on this server"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Rows are read and written chunk by chunk, memory doesn't grow with the session
+    parts = export_room(members['room_id'], dataset, writer)
+    if isinstance(request._request, ASGIRequest):
+        parts = aiter_sync(parts)
+    response = StreamingHttpResponse(parts, content_type=writer.content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{meeting_id}-{dataset}.{writer.extension}"')
+    return response
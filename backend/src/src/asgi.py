@@ -1,13 +1,17 @@
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from meeting_room.middleware import TokenAuthMiddlewareStack
-import meeting_room.routing as websocket_app
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
+# Set up Django before the consumers and middleware import models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from meeting_room.middleware import TokenAuthMiddlewareStack  # noqa: E402
+import meeting_room.routing as websocket_app  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": TokenAuthMiddlewareStack(
         URLRouter(websocket_app.websocket_urlpatterns)
     ),
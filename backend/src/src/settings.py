@@ -31,8 +31,8 @@ ALLOWED_HOSTS = ['*']
 # Application definition
 
 INSTALLED_APPS = [
-    # 'daphne',
-    # 'channels',
+    'daphne',
+    'channels',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -51,7 +51,6 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +58,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 ]
 
@@ -71,17 +69,21 @@ CUSTOM_USER_MODEL = 'meeting_room.CustomUser'
 
 SITE_ID = 1
 
-# ASGI_APPLICATION = 'src.asgi.application'
+ASGI_APPLICATION = 'src.asgi.application'
 
 # Channels
-# CHANNEL_LAYERS = {
-#     'default': {
-#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
-#         'CONFIG': {
-#             "hosts": [('127.0.0.1', 6379)],
-#         },
-#     },
-# }
+# Rooms are broadcast through this layer, so every worker process of a
+# deployment must share it. For several workers on one machine without
+# Redis, use 'meeting_room.layers.IPCChannelLayer' with the CONFIG
+# {"address": ('127.0.0.1', 6390)} and run `python manage.py run_channel_broker`.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            "hosts": [('127.0.0.1', 6379)],
+        },
+    },
+}
 
 # Cache settings
 CACHES = {
@@ -91,21 +93,110 @@ CACHES = {
     }
 }
 
-# Cache middleware settings
-CACHE_MIDDLEWARE_SECONDS = 300  # 5 minutes
-CACHE_MIDDLEWARE_KEY_PREFIX = 'focus_data'
+# Latest focus value per student is written behind to this store and
+# flushed to DataStream in bulk every FLUSH_INTERVAL seconds. Use
+# meeting_room.focus_store.LocalFocusStore for a single worker without Redis.
+FOCUS_STORE = {
+    'BACKEND': 'meeting_room.focus_store.RedisFocusStore',
+    'LOCATION': 'redis://127.0.0.1:6379',
+    'FLUSH_INTERVAL': 2,
+}
+
+# Focus history ingestion: samples are written with bulk_create every
+# BATCH_SIZE samples or FLUSH_INTERVAL_MS milliseconds, whichever comes first
+FOCUS_SAMPLE_BUFFER = {
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL_MS': 1000,
+}
+
+# Focus history retention: raw samples older than RAW_RETENTION seconds are
+# compacted into 1-minute and 1-hour buckets every INTERVAL seconds and
+# deleted. Minute buckets are kept MINUTE_RETENTION seconds, hour buckets for
+# good. Set INTERVAL to None and run `manage.py rollup_focus_history` from
+# cron instead to keep the rollup out of the web workers.
+FOCUS_ROLLUP = {
+    'RAW_RETENTION': 60 * 60 * 24,
+    'MINUTE_RETENTION': 60 * 60 * 24 * 7,
+    'INTERVAL': 60 * 10,
+}
+
+# Token -> user records are cached in each process for TTL seconds and in
+# the shared cache for SHARED_TTL seconds. Token deletion and user changes
+# invalidate both tiers of the current process and mark the shared entry so
+# lookups racing the change can't cache the token again.
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,
+    'SHARED': True,
+    'SHARED_TTL': 300,
+}
+
+# WebSocket presence: every connection is registered per room and expires
+# TTL seconds after its last heartbeat. Use meeting_room.presence.LocalPresenceStore
+# for a single worker without Redis.
+PRESENCE = {
+    'BACKEND': 'meeting_room.presence.RedisPresenceStore',
+    'LOCATION': 'redis://127.0.0.1:6379',
+    'TTL': 30,
+    'HEARTBEAT_INTERVAL': 10,
+}
+
+# WebSocket data frames of a room are merged per WINDOW_MS into one data_batch
+# event. Each sender may send RATE frames per second with bursts of BURST, a
+# room holds at most MAX_PENDING frames per window, the rest are dropped.
+DATA_BROADCAST = {
+    'WINDOW_MS': 250,
+    'RATE': 10,
+    'BURST': 20,
+    'MAX_PENDING': 1000,
+}
+
+# Database calls of consumers and WebSocket auth run on MAX_WORKERS threads
+# per process. New connections are closed with 1013 while more than MAX_QUEUE
+# calls wait or calls wait longer than SHED_WAIT_MS (None never sheds).
+DB_EXECUTOR = {
+    'MAX_WORKERS': 8,
+    'MAX_QUEUE': 200,
+    'SHED_WAIT_MS': 500,
+}
+
+# Queue depths, waits and counters of the database executor and the data
+# frame coalescer are logged by each worker process every INTERVAL seconds
+# (None disables the log).
+PROCESS_STATS = {
+    'INTERVAL': 60,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'meeting_room.stats': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
 # Rest framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'meeting_room.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'meeting_room.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ]
 }
 
+# JSON codec of WebSocket frames and API responses: 'orjson', 'json' for the
+# standard library, or 'auto' to use orjson when it is installed
+JSON_CODEC = 'auto'
+
 AUTH_USER_MODEL = 'meeting_room.CustomUser'
 
 TEMPLATES = [
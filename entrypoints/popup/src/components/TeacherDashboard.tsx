@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { useNavigate } from "react-router-dom";
 import {
   Search,
@@ -57,6 +57,8 @@ const TeacherDashboard = () => {
   const [isLoading, setIsLoading] = useState(true);
   const [meetingId, setMeetingId] = useState("");
   const [error, setError] = useState<string | null>(null);
+  // Cursor of the last poll, later polls only fetch students that changed
+  const focusCursorRef = useRef<number | null>(null);
 
   useEffect(() => {
     if (localStorage.getItem("teacherMeetingInfo")) {
@@ -112,16 +114,20 @@ const TeacherDashboard = () => {
         {
           headers: authHeader,
           signal: abortController.signal,
+          params:
+            focusCursorRef.current !== null
+              ? { since: focusCursorRef.current }
+              : {},
         }
       );
 
       // Validate and transform API response
-      const isValidData = Array.isArray(data);
+      const isValidData = data && Array.isArray(data.results);
       if (!isValidData) {
         throw new Error("Invalid data format received from server");
       }
 
-      const transformedData = data.map((item: any) => {
+      const transformedData = data.results.map((item: any) => {
         const timestamp = item.timestamp
           ? new Date(item.timestamp)
           : new Date();
@@ -145,7 +151,17 @@ const TeacherDashboard = () => {
 
       // Only update state if component is still mounted
       if (!abortController.signal.aborted) {
-        setStudents(transformedData);
+        const isDelta = focusCursorRef.current !== null;
+        setStudents((previous) => {
+          if (!isDelta) return transformedData;
+          // Merge the changed students into the current list
+          const byId = new Map(previous.map((student) => [student.id, student]));
+          transformedData.forEach((student: any) =>
+            byId.set(student.id, student)
+          );
+          return Array.from(byId.values());
+        });
+        focusCursorRef.current = data.cursor;
         setError(null);
       }
     } catch (error: any) {